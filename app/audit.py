@@ -0,0 +1,191 @@
+"""
+Password health audit: reuse, weakness and age.
+
+Results are stored per entry and contain nothing secret: a keyed reuse fingerprint
+(HMAC of the password alone under a key derived from the data key, so equal passwords
+can be grouped across applications), a 0-4 strength score and the time the password
+was last set. Every write path (create, CSV import, key rotation) fills them in from
+the plaintext it already holds; refresh() only visits entries written before the audit
+existed, so a report never rescans the vault.
+"""
+import datetime
+import hashlib
+import hmac
+import math
+import os
+from typing import Optional, Tuple
+
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.orm import Session
+
+from . import crypto, fields, models
+
+# Configuration
+# Entries scoring below AUDIT_MIN_STRENGTH are reported as weak, and passwords older
+# than AUDIT_MAX_AGE_DAYS as stale.
+AUDIT_MIN_STRENGTH = int(os.getenv("VAULT_AUDIT_MIN_STRENGTH", "3"))
+AUDIT_MAX_AGE_DAYS = int(os.getenv("VAULT_AUDIT_MAX_AGE_DAYS", "365"))
+AUDIT_BATCH_SIZE = int(os.getenv("VAULT_AUDIT_BATCH_SIZE", "1000"))
+
+REUSE_KEY_PURPOSE = b"audit-reuse"
+# Stored as the strength of entries that do not decrypt, so refresh() visits them only once
+UNREADABLE_STRENGTH = -1
+
+# Entropy (bits) needed for scores 1..4
+SCORE_BITS = (28, 36, 60, 80)
+# Whole-password matches score 0; as substrings they only count as one character
+COMMON_PASSWORDS = frozenset({
+    "123456", "123456789", "12345678", "1234567890", "qwerty", "password", "111111", "123123",
+    "abc123", "password1", "iloveyou", "admin", "welcome", "monkey", "dragon", "letmein",
+    "football", "baseball", "sunshine", "princess", "qwertyuiop", "000000", "login", "master",
+    "passw0rd", "trustno1", "changeme", "secret", "starwars", "superman",
+})
+COMMON_WORDS = ("password", "passw0rd", "qwerty", "letmein", "welcome", "admin", "login", "secret")
+
+
+def strength(password: str) -> int:
+    """
+    Rough 0 (trivial) to 4 (strong) score: effective length times bits per character of
+    the character classes used. Repeats, runs like "abc"/"321" and common words add
+    almost nothing to the effective length.
+    """
+    if not password or password.lower() in COMMON_PASSWORDS:
+        return 0
+    # Scored for every imported row, so the loops stay in C (map over str methods)
+    pool = 0
+    if any(map(str.islower, password)):
+        pool += 26
+    if any(map(str.isupper, password)):
+        pool += 26
+    if any(map(str.isdigit, password)):
+        pool += 10
+    if not password.isalnum():
+        pool += 33
+    if not password.isascii():
+        pool += 100
+
+    codes = list(map(ord, password))
+    effective = 1 + sum(abs(b - a) > 1 for a, b in zip(codes, codes[1:]))
+    lowered = password.lower()
+    for word in COMMON_WORDS:
+        if word in lowered:
+            effective -= len(word) - 1
+    bits = max(effective, 1) * math.log2(max(pool, 2))
+    return sum(1 for threshold in SCORE_BITS if bits >= threshold)
+
+
+class Auditor:
+    """Computes the stored audit columns for one data key."""
+
+    def __init__(self, dek: bytes):
+        self.reuse_key = crypto.derive_subkey(dek, REUSE_KEY_PURPOSE)
+
+    def reuse_fingerprint(self, password: str) -> bytes:
+        return hmac.new(self.reuse_key, password.encode('utf-8'), hashlib.sha256).digest()
+
+    def values(self, password: str, changed_at: Optional[datetime.datetime] = None) -> dict:
+        """Column values for an entry whose password was just set (changed_at defaults to now)."""
+        return {
+            "reuse_fingerprint": self.reuse_fingerprint(password),
+            "strength": strength(password),
+            "password_changed_at": changed_at or datetime.datetime.utcnow(),
+        }
+
+
+def refresh(db: Session, dek: bytes, cipher: crypto.CipherContext, batch_size: int = AUDIT_BATCH_SIZE) -> Tuple[int, int]:
+    """
+    Audits entries stored without results, batch by batch. Entries that do not decrypt are
+    marked with UNREADABLE_STRENGTH. Returns (entries audited, entries newly found unreadable).
+    """
+    auditor = Auditor(dek)
+    table = models.PasswordEntry.__table__
+    audited = unreadable = 0
+    last_id = None
+    while True:
+        query = (
+            select(table.c.id, table.c.encrypted_password, table.c.nonce, table.c.created_at, table.c.password_changed_at)
+            .where(table.c.strength.is_(None))
+            .order_by(table.c.id)
+            .limit(batch_size)
+        )
+        if last_id is not None:
+            query = query.where(table.c.id > last_id)
+        rows = db.execute(query).all()
+        if not rows:
+            return audited, unreadable
+        last_id = rows[-1].id
+        plaintexts = cipher.decrypt_many([(r.encrypted_password, r.nonce) for r in rows])
+        updates, failed = [], []
+        for r, plaintext in zip(rows, plaintexts):
+            if plaintext is None:
+                failed.append({"b_id": r.id, "strength": UNREADABLE_STRENGTH})
+            else:
+                updates.append({"b_id": r.id, **auditor.values(plaintext, r.password_changed_at or r.created_at)})
+        for values in (updates, failed):
+            if values:
+                db.execute(update(table).where(table.c.id == bindparam("b_id")), values)
+        db.commit()
+        audited += len(updates)
+        unreadable += len(failed)
+
+
+# --- REPORT ---
+def entry_select():
+    entry = models.PasswordEntry
+    return (
+        select(
+            entry.id, entry.application_id, models.Application.name.label("application"),
+            entry.username, entry.encrypted_username, entry.environment,
+            entry.strength, entry.password_changed_at, entry.reuse_fingerprint
+        )
+        .join(models.Application, models.Application.id == entry.application_id)
+    )
+
+def entry_dict(row, codec: fields.FieldCodec) -> dict:
+    return {
+        "id": row.id,
+        "application_id": row.application_id,
+        "application": row.application,
+        "username": codec.username(row.username, row.encrypted_username),
+        "environment": row.environment,
+        "strength": row.strength,
+        "password_changed_at": row.password_changed_at,
+    }
+
+def report(db: Session, codec: fields.FieldCodec, limit: int = 100) -> dict:
+    """Counts plus up to limit weak entries, reuse groups and stale entries (worst first)."""
+    entry = models.PasswordEntry
+    total, audited = db.execute(select(
+        func.count(entry.id), func.count(entry.id).filter(entry.strength > UNREADABLE_STRENGTH)
+    )).one()
+
+    weak = entry.strength.between(0, AUDIT_MIN_STRENGTH - 1)
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=AUDIT_MAX_AGE_DAYS)
+    stale = entry.password_changed_at < cutoff
+
+    groups = (
+        select(entry.reuse_fingerprint, func.count().label("count"))
+        .where(entry.reuse_fingerprint.is_not(None))
+        .group_by(entry.reuse_fingerprint)
+        .having(func.count() > 1)
+        .subquery()
+    )
+    reuse_groups, reused = db.execute(select(func.count(), func.coalesce(func.sum(groups.c.count), 0))).one()
+    top = db.execute(select(groups.c.reuse_fingerprint, groups.c.count).order_by(groups.c.count.desc()).limit(limit)).all()
+    members = {}
+    if top:
+        rows = db.execute(entry_select().where(entry.reuse_fingerprint.in_([g.reuse_fingerprint for g in top])))
+        for row in rows:
+            members.setdefault(row.reuse_fingerprint, []).append(entry_dict(row, codec))
+
+    return {
+        "entries": total,
+        "audited": audited,
+        "weak_count": db.execute(select(func.count(entry.id)).where(weak)).scalar(),
+        "reused_count": reused,
+        "reuse_groups": reuse_groups,
+        "stale_count": db.execute(select(func.count(entry.id)).where(stale)).scalar(),
+        "weak": [entry_dict(r, codec) for r in db.execute(entry_select().where(weak).order_by(entry.strength, entry.id).limit(limit))],
+        "reused": [{"count": g.count, "entries": members.get(g.reuse_fingerprint, [])} for g in top],
+        "stale": [entry_dict(r, codec) for r in db.execute(entry_select().where(stale).order_by(entry.password_changed_at).limit(limit))],
+    }
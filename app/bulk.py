@@ -0,0 +1,103 @@
+"""
+Set-based creation of categories and applications, shared by the JSON and CSV imports.
+Existing rows are prefetched, the difference is computed in memory, and new rows are
+written with one executemany INSERT ... ON CONFLICT DO NOTHING RETURNING per table.
+"""
+import uuid
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from . import database, models
+
+# Keeps IN (...) lists well below SQLite's bound-parameter limit
+CHUNK_SIZE = 500
+
+AppKey = Tuple[uuid.UUID, str]  # (category_id, application name)
+
+
+def chunked(items: List, size: int = CHUNK_SIZE) -> Iterator[List]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def insert_rows(db: Session, table, rows: List[dict]) -> Set[uuid.UUID]:
+    """
+    Inserts rows, skipping unique-constraint conflicts, and returns the IDs actually inserted.
+    Without executemany RETURNING support every row is reported as a possible conflict,
+    which makes callers fall back to re-reading the IDs.
+    """
+    stmt = database.insert_ignore(db.get_bind(), table)
+    if db.get_bind().dialect.insert_executemany_returning:
+        return set(db.execute(stmt.returning(table.c.id), rows).scalars())
+    db.execute(stmt, rows)
+    return set()
+
+
+def ensure_categories(db: Session, wanted: Dict[str, Optional[str]]) -> Tuple[Dict[str, uuid.UUID], int]:
+    """
+    Makes sure every category name in wanted (name -> description) exists.
+    Returns (name -> id for all existing categories, number created).
+    """
+    ids = {name: cat_id for cat_id, name in db.execute(select(models.Category.id, models.Category.name))}
+    missing = [name for name in wanted if name not in ids]
+    if not missing:
+        return ids, 0
+
+    rows = [{"id": uuid.uuid4(), "name": name, "description": wanted[name]} for name in missing]
+    inserted = insert_rows(db, models.Category.__table__, rows)
+    for row in rows:
+        if row["id"] in inserted:
+            ids[row["name"]] = row["id"]
+
+    # Names skipped by ON CONFLICT were created concurrently: read their real IDs
+    conflicts = [row["name"] for row in rows if row["id"] not in inserted]
+    for names in chunked(conflicts):
+        for cat_id, name in db.execute(select(models.Category.id, models.Category.name).where(models.Category.name.in_(names))):
+            ids[name] = cat_id
+    return ids, len(rows) - len(conflicts)
+
+
+def lookup_applications(db: Session, keys: List[AppKey]) -> Dict[AppKey, uuid.UUID]:
+    """Finds the IDs of existing applications among keys, probing the name index chunk by chunk."""
+    ids: Dict[AppKey, uuid.UUID] = {}
+    wanted = set(keys)
+    names = list({name for _, name in keys})
+    for chunk in chunked(names):
+        rows = db.execute(
+            select(models.Application.id, models.Application.category_id, models.Application.name)
+            .where(models.Application.name.in_(chunk))
+        )
+        for app_id, cat_id, name in rows:
+            if (cat_id, name) in wanted:
+                ids[(cat_id, name)] = app_id
+    return ids
+
+
+def ensure_applications(db: Session, wanted: Dict[AppKey, Optional[str]], codec=None) -> Tuple[Dict[AppKey, uuid.UUID], int]:
+    """
+    Makes sure every (category_id, name) in wanted (key -> description) exists.
+    Descriptions are stored through codec (a fields.FieldCodec) when given.
+    Returns (key -> id for the wanted applications, number created).
+    """
+    ids = lookup_applications(db, list(wanted))
+    missing = [key for key in wanted if key not in ids]
+    if not missing:
+        return ids, 0
+
+    rows = []
+    for cat_id, name in missing:
+        description = wanted[(cat_id, name)]
+        values = codec.description_values(description) if codec else {"description": description}
+        rows.append({"id": uuid.uuid4(), "category_id": cat_id, "name": name, **values})
+    inserted = insert_rows(db, models.Application.__table__, rows)
+    for row in rows:
+        if row["id"] in inserted:
+            ids[(row["category_id"], row["name"])] = row["id"]
+
+    # Keys skipped by ON CONFLICT were created concurrently: read their real IDs
+    conflicts = [(row["category_id"], row["name"]) for row in rows if row["id"] not in inserted]
+    if conflicts:
+        ids.update(lookup_applications(db, conflicts))
+    return ids, len(rows) - len(conflicts)
@@ -0,0 +1,121 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, NamedTuple, Optional, Tuple
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from . import database, models
+
+# Configuration
+# Listing responses are cached as serialized JSON, tagged with a generation counter that
+# every route changing categories or applications bumps. "memory" keeps the counter in
+# the process; "database" shares it between worker processes through the
+# cache_generations table (one primary-key read per request); "off" disables caching.
+RESPONSE_CACHE_BACKEND = os.getenv("VAULT_RESPONSE_CACHE", "memory")
+RESPONSE_CACHE_SIZE = int(os.getenv("VAULT_RESPONSE_CACHE_SIZE", "256"))
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    etag: str
+    headers: Dict[str, str]
+
+
+class MemoryGeneration:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    async def current(self, db: AsyncSession) -> int:
+        return self.value
+
+    def bump(self, db: Session):
+        with self._lock:
+            self.value += 1
+
+
+class DatabaseGeneration:
+    """Counter row shared by every worker using the same database."""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    async def current(self, db: AsyncSession) -> int:
+        value = (await db.execute(
+            select(models.CacheGeneration.value).where(models.CacheGeneration.name == self.name)
+        )).scalar()
+        return value or 0
+
+    def read(self, db: Session) -> int:
+        """current() for synchronous sessions."""
+        return db.execute(
+            select(models.CacheGeneration.value).where(models.CacheGeneration.name == self.name)
+        ).scalar() or 0
+
+    def bump(self, db: Session):
+        table = models.CacheGeneration.__table__
+        result = db.execute(update(table).where(table.c.name == self.name).values(value=table.c.value + 1))
+        if not result.rowcount:
+            db.execute(database.insert_ignore(db.get_bind(), table), {"name": self.name, "value": 1})
+        db.commit()
+
+
+class ResponseCache:
+    """LRU of serialized responses; entries from an older generation are never served."""
+
+    def __init__(self, name: str, backend: str = RESPONSE_CACHE_BACKEND, max_entries: int = RESPONSE_CACHE_SIZE):
+        if backend not in ("memory", "database", "off"):
+            raise ValueError(f"Unknown response cache backend: {backend}")
+        self.enabled = backend != "off"
+        self.generation = DatabaseGeneration(name) if backend == "database" else MemoryGeneration()
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, Tuple[int, CachedResponse]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def lookup(self, db: AsyncSession, key: Hashable) -> Tuple[int, Optional[CachedResponse]]:
+        """Returns the current generation and the cached response for key, if still valid."""
+        if not self.enabled:
+            return 0, None
+        generation = await self.generation.current(db)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == generation:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return generation, entry[1]
+            self.misses += 1
+        return generation, None
+
+    def store(self, key: Hashable, generation: int, body: bytes, headers: Optional[Dict[str, str]] = None) -> CachedResponse:
+        """
+        Caches body under the generation read *before* querying, so a change committed
+        in between leaves the entry stale rather than wrongly current.
+        """
+        etag = '"%s"' % hashlib.sha256(body).hexdigest()[:32]
+        response = CachedResponse(body, etag, headers or {})
+        if self.enabled:
+            with self._lock:
+                self._entries[key] = (generation, response)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return response
+
+    def invalidate(self, db: Session):
+        """Call after committing a change to the cached data."""
+        if self.enabled:
+            self.generation.bump(db)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Category and application listings
+listings = ResponseCache("listings")
@@ -0,0 +1,65 @@
+"""
+Benchmarks Argon2id on this host and suggests KDF / hasher parameters for a latency
+and memory budget. Paste the printed variables into the server environment; existing
+vaults move to them on their next successful login.
+
+    python -m app.calibrate --target-ms 500 --max-memory-mib 256
+"""
+import argparse
+import os
+import time
+
+from . import crypto
+
+MIN_MEMORY_KIB = 19 * 1024  # OWASP minimum for Argon2id
+PROBE_PASSWORD = "calibration-probe"
+
+
+def measure(params: crypto.KdfParams, rounds: int = 3) -> float:
+    """Best-of-rounds key derivation time in milliseconds."""
+    salt = crypto.generate_salt()
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        crypto.derive_key_uncached(PROBE_PASSWORD, salt, params)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def calibrate(target_ms: float, max_memory_kib: int, parallelism: int) -> crypto.KdfParams:
+    """
+    Uses as much memory as the budget allows (memory-hardness matters most), shrinking it
+    only if a single pass already misses the target, then spends the remaining time on passes.
+    """
+    memory = max(MIN_MEMORY_KIB, max_memory_kib)
+    params = crypto.KdfParams(1, memory, parallelism)
+    elapsed = measure(params)
+    while elapsed > target_ms and params.memory_cost // 2 >= MIN_MEMORY_KIB:
+        params = params._replace(memory_cost=params.memory_cost // 2)
+        elapsed = measure(params)
+
+    params = params._replace(time_cost=max(1, int(target_ms // elapsed)))
+    # Passes do not scale perfectly linearly; back off until within the target
+    while params.time_cost > 1 and measure(params) > target_ms * 1.1:
+        params = params._replace(time_cost=params.time_cost - 1)
+    return params
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--target-ms", type=float, default=500, help="latency budget for one derivation (default 500)")
+    parser.add_argument("--max-memory-mib", type=int, default=256, help="memory budget per derivation in MiB (default 256)")
+    parser.add_argument("--parallelism", type=int, default=min(4, os.cpu_count() or 1), help="lanes (default: min(4, CPUs))")
+    args = parser.parse_args()
+
+    params = calibrate(args.target_ms, args.max_memory_mib * 1024, args.parallelism)
+    elapsed = measure(params)
+    print(f"# Argon2id: {params.time_cost} passes, {params.memory_cost // 1024} MiB, {params.parallelism} lanes -> {elapsed:.0f} ms on this host")
+    for prefix in ("VAULT_KDF", "VAULT_HASH"):
+        print(f"{prefix}_TIME_COST={params.time_cost}")
+        print(f"{prefix}_MEMORY_COST={params.memory_cost}")
+        print(f"{prefix}_PARALLELISM={params.parallelism}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,16 @@
 import os
 import base64
-from typing import Tuple
+import hashlib
+import hmac
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from argon2 import PasswordHasher
 from argon2.exceptions import VerifyMismatchError
 
@@ -11,13 +20,120 @@ from argon2.exceptions import VerifyMismatchError
 NONCE_LENGTH = 12
 KEY_LENGTH = 32 # 32 bytes = 256 bits
 
-ph = PasswordHasher()
+# Derived-key cache: number of keys kept and their lifetime in seconds (0 disables it)
+KEY_CACHE_SIZE = int(os.getenv("VAULT_KEY_CACHE_SIZE", "8"))
+KEY_CACHE_TTL = int(os.getenv("VAULT_KEY_CACHE_TTL", "300"))
+
+class KdfParams(NamedTuple):
+    """Argon2id cost parameters; memory_cost is in KiB."""
+    time_cost: int
+    memory_cost: int
+    parallelism: int
+
+# Parameters every vault used before they were configurable (and stored per user)
+LEGACY_KDF_PARAMS = KdfParams(time_cost=3, memory_cost=65536, parallelism=4)
+
+# Key derivation for new keys (setup, password change, upgrade on login).
+# Run `python -m app.calibrate` to pick values for this host.
+KDF_PARAMS = KdfParams(
+    time_cost=int(os.getenv("VAULT_KDF_TIME_COST", str(LEGACY_KDF_PARAMS.time_cost))),
+    memory_cost=int(os.getenv("VAULT_KDF_MEMORY_COST", str(LEGACY_KDF_PARAMS.memory_cost))),
+    parallelism=int(os.getenv("VAULT_KDF_PARALLELISM", str(LEGACY_KDF_PARAMS.parallelism))),
+)
+
+# Master password hash; stored hashes carry their own parameters and are
+# upgraded on the next successful login when these change (see needs_rehash).
+ph = PasswordHasher(
+    time_cost=int(os.getenv("VAULT_HASH_TIME_COST", "3")),
+    memory_cost=int(os.getenv("VAULT_HASH_MEMORY_COST", "65536")),
+    parallelism=int(os.getenv("VAULT_HASH_PARALLELISM", "4")),
+)
+
+class KeyCache:
+    """
+    Bounded LRU cache of Argon2-derived keys with TTL expiry.
+    Entries are keyed on an HMAC of (password, salt, KDF parameters) under a random per-process secret,
+    so neither the password nor an offline-attackable hash of it is kept in memory.
+    Key material is stored in bytearrays and overwritten when an entry is evicted.
+    """
+
+    def __init__(self, max_size: int = KEY_CACHE_SIZE, ttl: int = KEY_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._secret = os.urandom(32)
+        self._entries: "OrderedDict[bytes, Tuple[bytearray, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def fingerprint(self, password: str, salt: bytes, params: KdfParams = KDF_PARAMS) -> bytes:
+        mac = hmac.new(self._secret, digestmod=hashlib.sha256)
+        for value in params:
+            mac.update(value.to_bytes(8, "big"))
+        mac.update(len(salt).to_bytes(4, "big"))
+        mac.update(salt)
+        mac.update(password.encode('utf-8'))
+        return mac.digest()
+
+    def get(self, fingerprint: bytes) -> Optional[bytes]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry is None:
+                self.misses += 1
+                return None
+            key, expires_at = entry
+            if now >= expires_at:
+                self._evict(fingerprint)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(fingerprint)
+            self.hits += 1
+            return bytes(key)
+
+    def put(self, fingerprint: bytes, key: bytes):
+        if self.max_size <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            if fingerprint in self._entries:
+                self._evict(fingerprint)
+            self._entries[fingerprint] = (bytearray(key), time.monotonic() + self.ttl)
+            while len(self._entries) > self.max_size:
+                self._evict(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            for fingerprint in list(self._entries):
+                self._evict(fingerprint)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+    def _evict(self, fingerprint: bytes):
+        key, _ = self._entries.pop(fingerprint)
+        key[:] = bytes(len(key))
+        self.evictions += 1
+
+key_cache = KeyCache()
 
 def generate_salt() -> bytes:
     """Generates a random salt."""
     return os.urandom(16)
 
-def derive_key(master_password: str, salt: bytes) -> bytes:
+def derive_key(master_password: str, salt: bytes, params: KdfParams = KDF_PARAMS) -> bytes:
+    """
+    Returns the AES key for (master_password, salt, params), served from key_cache when possible.
+    """
+    fingerprint = key_cache.fingerprint(master_password, salt, params)
+    key = key_cache.get(fingerprint)
+    if key is None:
+        key = derive_key_uncached(master_password, salt, params)
+        key_cache.put(fingerprint, key)
+    return key
+
+def derive_key_uncached(master_password: str, salt: bytes, params: KdfParams = KDF_PARAMS) -> bytes:
     """
     Derives a 32-byte (256-bit) AES key from the master password and salt.
     Note: In a production system we might use Argon2 specifically for key derivation (Argon2id KDF),
@@ -33,42 +149,141 @@ def derive_key(master_password: str, salt: bytes) -> bytes:
     key = hash_secret_raw(
         secret=master_password.encode('utf-8'),
         salt=salt,
-        time_cost=3,
-        memory_cost=65536,
-        parallelism=4,
+        time_cost=params.time_cost,
+        memory_cost=params.memory_cost,
+        parallelism=params.parallelism,
         hash_len=KEY_LENGTH,
         type=Type.ID
     )
     return key
 
+class CipherContext:
+    """
+    AES-256-GCM bound to one derived key. Create it once per key and reuse it for
+    every entry instead of re-initialising the cipher per call.
+    previous_keys are tried, in order, for entries the key does not open (GCM
+    authentication makes a wrong key fail rather than return garbage).
+    Pickles as its keys, so bound methods can be sent to a process pool.
+    """
+
+    def __init__(self, master_key: bytes, previous_keys: Sequence[bytes] = ()):
+        self._key = bytes(master_key)
+        self._previous_keys = tuple(bytes(k) for k in previous_keys)
+        self._aesgcm = AESGCM(self._key)
+        self._fallbacks = [AESGCM(k) for k in self._previous_keys]
+
+    def __reduce__(self):
+        return (CipherContext, (self._key, self._previous_keys))
+
+    def _open(self, nonce: bytes, ciphertext_with_tag: bytes) -> bytes:
+        try:
+            return self._aesgcm.decrypt(nonce, ciphertext_with_tag, None)
+        except InvalidTag:
+            for fallback in self._fallbacks:
+                try:
+                    return fallback.decrypt(nonce, ciphertext_with_tag, None)
+                except InvalidTag:
+                    continue
+            raise
+
+    def encrypt(self, plaintext: str) -> Tuple[bytes, bytes]:
+        """Returns (ciphertext_with_tag, nonce)."""
+        nonce = os.urandom(NONCE_LENGTH)
+        return self._aesgcm.encrypt(nonce, plaintext.encode('utf-8'), None), nonce
+
+    def decrypt(self, ciphertext_with_tag: bytes, nonce: bytes) -> str:
+        try:
+            return self._open(nonce, ciphertext_with_tag).decode('utf-8')
+        except Exception as e:
+            raise ValueError("Decryption failed. Invalid Key or Data Corrupted.") from e
+
+    def encrypt_many(self, plaintexts: List[str]) -> List[Tuple[bytes, bytes]]:
+        """Encrypts a batch; the nonces are sliced from a single os.urandom() call."""
+        nonces = os.urandom(NONCE_LENGTH * len(plaintexts))
+        encrypt = self._aesgcm.encrypt
+        results = []
+        for i, plaintext in enumerate(plaintexts):
+            nonce = nonces[i * NONCE_LENGTH:(i + 1) * NONCE_LENGTH]
+            results.append((encrypt(nonce, plaintext.encode('utf-8'), None), nonce))
+        return results
+
+    def decrypt_many(self, items: List[Tuple[bytes, bytes]]) -> List[Optional[str]]:
+        """
+        Decrypts (ciphertext_with_tag, nonce) pairs.
+        Entries that fail authentication come back as None instead of aborting the batch.
+        """
+        decrypt = self._open
+        results = []
+        for ciphertext_with_tag, nonce in items:
+            try:
+                results.append(decrypt(nonce, ciphertext_with_tag).decode('utf-8'))
+            except Exception:
+                results.append(None)
+        return results
+
 def encrypt_password(plaintext: str, master_key: bytes) -> Tuple[bytes, bytes]:
     """
     Encrypts plaintext using AES-256-GCM.
-    Returns (ciphertext, nonce).
-    Auth Tag is included in the ciphertext by the library normally, or appended.
-    cryptography.hazmat.primitives.ciphers.aead.AESGCM.encrypt returns ciphertext + tag.
+    Returns (ciphertext, nonce); the auth tag is appended to the ciphertext.
     """
-    aesgcm = AESGCM(master_key)
-    nonce = os.urandom(NONCE_LENGTH)
-    # encrypt(nonce, data, associated_data)
-    ciphertext = aesgcm.encrypt(nonce, plaintext.encode('utf-8'), None)
-    return ciphertext, nonce
+    return CipherContext(master_key).encrypt(plaintext)
 
 def decrypt_password(ciphertext_with_tag: bytes, nonce: bytes, master_key: bytes) -> str:
     """
     Decrypts data using AES-256-GCM.
     """
-    aesgcm = AESGCM(master_key)
+    return CipherContext(master_key).decrypt(ciphertext_with_tag, nonce)
+
+def encrypt_many(plaintexts: List[str], master_key: bytes) -> List[Tuple[bytes, bytes]]:
+    return CipherContext(master_key).encrypt_many(plaintexts)
+
+def decrypt_many(items: List[Tuple[bytes, bytes]], master_key: bytes) -> List[Optional[str]]:
+    return CipherContext(master_key).decrypt_many(items)
+
+# --- Key wrapping ---
+# Entries are sealed with a random data-encryption key (DEK); only the DEK is sealed
+# with the key derived from the master password, so changing the password re-wraps 32 bytes.
+DEK_WRAP_AD = b"vault:dek"
+
+def generate_data_key() -> bytes:
+    return os.urandom(KEY_LENGTH)
+
+def wrap_key(wrapping_key: bytes, key: bytes) -> bytes:
+    """Returns nonce || AES-GCM(key)."""
+    nonce = os.urandom(NONCE_LENGTH)
+    return nonce + AESGCM(bytes(wrapping_key)).encrypt(nonce, bytes(key), DEK_WRAP_AD)
+
+def unwrap_key(wrapping_key: bytes, wrapped: bytes) -> bytes:
     try:
-        plaintext_bytes = aesgcm.decrypt(nonce, ciphertext_with_tag, None)
-        return plaintext_bytes.decode('utf-8')
-    except Exception as e:
-        raise ValueError("Decryption failed. Invalid Key or Data Corrupted.") from e
+        return AESGCM(bytes(wrapping_key)).decrypt(wrapped[:NONCE_LENGTH], wrapped[NONCE_LENGTH:], DEK_WRAP_AD)
+    except InvalidTag as e:
+        raise ValueError("Key unwrap failed. Invalid wrapping key or data corrupted.") from e
+
+FINGERPRINT_KEY_PURPOSE = b"entry-fingerprint"
+
+def derive_subkey(master_key: bytes, purpose: bytes) -> bytes:
+    """Derives an independent 32-byte key for a non-encryption purpose (HKDF-SHA256)."""
+    return HKDF(algorithm=hashes.SHA256(), length=KEY_LENGTH, salt=None, info=b"vault:" + purpose).derive(bytes(master_key))
+
+def entry_fingerprint(index_key: bytes, application_id: uuid.UUID, username: str, password: str) -> bytes:
+    """
+    Keyed HMAC-SHA256 over (application, username, password), used to spot duplicate
+    entries with an indexed lookup. Without index_key it reveals nothing about the password.
+    """
+    mac = hmac.new(index_key, digestmod=hashlib.sha256)
+    for part in (application_id.bytes, username.encode('utf-8'), password.encode('utf-8')):
+        mac.update(len(part).to_bytes(4, "big"))
+        mac.update(part)
+    return mac.digest()
 
 def hash_master_password(password: str) -> str:
     """Hashes the master password for storage (authentication)."""
     return ph.hash(password)
 
+def needs_rehash(hash_str: str) -> bool:
+    """True if hash_str was made with parameters other than the configured hasher's."""
+    return ph.check_needs_rehash(hash_str)
+
 def verify_master_password(password: str, hash_str: str) -> bool:
     """Verifies the master password against the stored hash."""
     try:
@@ -1,125 +1,399 @@
+import codecs
 import csv
+import datetime
+import functools
 import io
-from typing import Tuple, Optional
+import os
+import uuid
+from typing import BinaryIO, Callable, Iterator, List, Tuple, Optional, Union
+from sqlalchemy import and_, bindparam, insert, or_, select, update
 from sqlalchemy.orm import Session
-from . import models, crypto
+from . import models, crypto, bulk, workers, keys, users, fields, audit
 
-def process_csv_import(file_content: bytes, master_password: str, db: Session) -> Tuple[int, int]:
+# Bytes read from the upload per call, and rows committed per transaction
+READ_CHUNK_SIZE = 64 * 1024
+IMPORT_BATCH_SIZE = int(os.getenv("VAULT_IMPORT_BATCH_SIZE", "1000"))
+# Smallest slice of a batch worth handing to a separate crypto worker
+CRYPTO_CHUNK_MIN = 256
+# Per-row errors kept for reporting (the error count itself is unbounded)
+MAX_ERROR_DETAILS = 100
+# Fingerprint stored for entries that do not decrypt, so backfills skip them; it never
+# equals a real one (HMAC-SHA256 output)
+UNREADABLE_FINGERPRINT = b""
+
+# What to do with rows matching an entry already in the vault:
+# skip exact duplicates (same app/username/password), update the password of the
+# entry with the same app/username, or keep both.
+DUPLICATES_SKIP = "skip"
+DUPLICATES_UPDATE = "update"
+DUPLICATES_KEEP = "keep"
+DUPLICATE_MODES = (DUPLICATES_SKIP, DUPLICATES_UPDATE, DUPLICATES_KEEP)
+
+class ImportStats:
+    """Running totals of an import, passed to the progress callback after every batch."""
+    def __init__(self):
+        self.rows = 0
+        self.success = 0
+        self.updated = 0
+        self.duplicates = 0
+        self.errors = 0
+        self.batches = 0
+        # (line number, reason) of the first MAX_ERROR_DETAILS failed rows
+        self.error_details: List[Tuple[int, str]] = []
+
+    def add_error(self, line: int, reason: str):
+        self.errors += 1
+        if len(self.error_details) < MAX_ERROR_DETAILS:
+            self.error_details.append((line, reason))
+
+def iter_lines(source: BinaryIO, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[str]:
+    """
+    Decodes a binary stream incrementally as UTF-8 (an optional BOM is dropped)
+    and yields lines with their endings, holding at most one chunk in memory.
+    Raises UnicodeDecodeError (a ValueError) on invalid input.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    while True:
+        chunk = source.read(chunk_size)
+        pending += decoder.decode(chunk, final=not chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line + "\n"
+        if not chunk:
+            break
+    if pending:
+        yield pending
+
+def process_csv_import(
+    source: Union[bytes, BinaryIO],
+    master_key: bytes,
+    db: Session,
+    batch_size: int = IMPORT_BATCH_SIZE,
+    progress: Optional[Callable[[ImportStats], None]] = None,
+    stats: Optional[ImportStats] = None,
+    duplicates: str = DUPLICATES_SKIP,
+    key_version: Optional[int] = None
+) -> Tuple[int, int]:
     """
     Parses CSV content (Chrome export or Generic), encrypts passwords, and saves to DB.
+    source is read incrementally, and every batch_size rows are committed in their own
+    transaction, so memory stays flat regardless of file size. progress, if given,
+    is called with the running ImportStats after each commit; an exception raised
+    by it (e.g. a cancellation) stops the import with the committed batches kept.
+    Pass stats to observe the running totals from another thread.
+    duplicates is one of DUPLICATE_MODES; duplicates are found through the indexed
+    PasswordEntry.fingerprint column without decrypting the vault.
+    The caller is responsible for authenticating and deriving master_key, and passes the
+    User.dek_version it belongs to as key_version (default: the current one). If the key
+    is rotated mid-import, the next batch raises keys.KeyRotated; committed batches are kept.
+    Duplicate matching needs every fingerprint under the same key, so unless duplicates is
+    DUPLICATES_KEEP, importing during a rotation raises keys.RotationInProgress.
     Returns (success_count, error_count).
     
     Supported Columns (Case-insensitive):
     - Chrome: name, url, username, password
     - Generic: category, application, username, password, environment, notes
     """
-    # 1. Verify/Prepare User/Keys
-    user = db.query(models.User).first()
-    if not user:
-         raise ValueError("System not initialized")
-    
-    if not crypto.verify_master_password(master_password, user.password_hash):
-        raise ValueError("Invalid Master Password")
-
-    master_key = crypto.derive_key(master_password, user.master_key_salt)
+    if duplicates not in DUPLICATE_MODES:
+        raise ValueError(f"Invalid duplicates mode: {duplicates}")
 
-    # 2. Parse CSV
-    content_str = file_content.decode('utf-8')
-    csv_file = io.StringIO(content_str)
+    # 1. Parse CSV
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
     
     # Sniff header to support different formats more robustly if needed, 
     # but DictReader is usually good enough if we check for column variations.
-    reader = csv.DictReader(csv_file)
+    reader = csv.DictReader(iter_lines(source))
     
     # Normalize headers to lowercase to handle variations
     if reader.fieldnames:
         reader.fieldnames = [f.lower().strip() for f in reader.fieldnames]
 
-    success_count = 0
-    error_count = 0
+    if stats is None:
+        stats = ImportStats()
 
-    # Cache categories and apps to reduce DB queries
-    # Key: Name -> ID
-    category_cache = {}
-    # Key: (CategoryID, AppName) -> ID
-    app_cache = {}
+    importer = BatchImporter(db, master_key, stats, duplicates, key_version)
+    if duplicates != DUPLICATES_KEEP:
+        keys.check_not_rotating(db)
+        # Entries stored before fingerprints existed must be indexed once to be matched
+        backfill_fingerprints(db, master_key, batch_size, importer.key_version)
 
-    # Pre-populate caches
-    for cat in db.query(models.Category).all():
-        category_cache[cat.name] = cat.id
-        for app in cat.applications:
-             app_cache[(cat.id, app.name)] = app.id
-
-    # 3. Process Rows
+    # 2. Process Rows, batch_size at a time
+    batch = []
     for row in reader:
-        try:
-            # --- Extract Data with Fallbacks ---
-            
-            # Application Name
-            app_name = row.get('name') or row.get('application') or row.get('site_name') or row.get('title')
-            
-            # Password
-            raw_password = row.get('password') or row.get('pass')
-            
-            # Username
-            username = row.get('username') or row.get('user') or row.get('login') or ""
-
-            # URL / Note
-            url = row.get('url') or row.get('website') or ""
-            note = row.get('note') or row.get('notes') or ""
-            full_description = f"{url} {note}".strip()
-
-            # Category - Default to "Imported" if not present
-            cat_name = row.get('category') or row.get('group') or "Imported"
-
-            # Environment
-            env = row.get('environment') or "Production"
-
-            # Validation
-            if not app_name or not raw_password:
-                error_count += 1
+        stats.rows += 1
+        # line_num counts physical lines, so quoted multi-line fields are accounted for
+        batch.append((reader.line_num, row))
+        if len(batch) >= batch_size:
+            importer.import_batch(batch)
+            commit_batch(db, stats, progress)
+            batch = []
+
+    if batch or not stats.rows:
+        importer.import_batch(batch)
+        commit_batch(db, stats, progress)
+    return stats.success, stats.errors
+
+def parse_row(row: dict) -> Optional[dict]:
+    """Extracts a password entry from a CSV row (with fallbacks); None if it is unusable."""
+    # Application Name
+    app_name = row.get('name') or row.get('application') or row.get('site_name') or row.get('title')
+    
+    # Password
+    raw_password = row.get('password') or row.get('pass')
+
+    # Validation
+    if not app_name or not raw_password:
+        return None
+    
+    # URL / Note
+    url = row.get('url') or row.get('website') or ""
+    note = row.get('note') or row.get('notes') or ""
+
+    return {
+        "app_name": app_name,
+        "password": raw_password,
+        "username": row.get('username') or row.get('user') or row.get('login') or "",
+        "description": f"{url} {note}".strip(),
+        # Category - Default to "Imported" if not present
+        "category": row.get('category') or row.get('group') or "Imported",
+        "environment": row.get('environment') or "Production"
+    }
+
+class RowCrypto:
+    """
+    The per-row work of an import (HMACs, strength scoring, AES-GCM), over chunks of rows
+    so it can run on the crypto pool. Holds only keys and pickles as them, so its bound
+    methods also work with the process executor.
+    """
+
+    def __init__(self, master_key: bytes):
+        self.cipher = crypto.CipherContext(master_key)
+        self.index_key = crypto.derive_subkey(master_key, crypto.FINGERPRINT_KEY_PURPOSE)
+        self.codec = fields.FieldCodec(master_key, self.cipher)
+        self.auditor = audit.Auditor(master_key)
+
+    def digest(self, rows: List[Tuple[uuid.UUID, str, str]]) -> List[Tuple[bytes, bytes]]:
+        """(fingerprint, username index) of each (application_id, username, password)."""
+        index_key, username_index = self.index_key, self.codec.username_index
+        return [
+            (crypto.entry_fingerprint(index_key, app_id, username, password), username_index(username))
+            for app_id, username, password in rows
+        ]
+
+    def seal(self, rows: List[Tuple[str, str]], changed_at: datetime.datetime) -> List[dict]:
+        """Column values for each (username, password): sealed password, username and audit results."""
+        sealed = self.cipher.encrypt_many([password for _, password in rows])
+        username_values, audit_values = self.codec.username_values, self.auditor.values
+        return [
+            {"encrypted_password": ciphertext, "nonce": nonce, **username_values(username), **audit_values(password, changed_at)}
+            for (username, password), (ciphertext, nonce) in zip(rows, sealed)
+        ]
+
+
+def on_pool(fn: Callable[[list], list], items: list) -> list:
+    """fn over items, split into one chunk per crypto worker (at least CRYPTO_CHUNK_MIN items each)."""
+    chunk_size = max(CRYPTO_CHUNK_MIN, -(-len(items) // workers.pool.workers))
+    chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+    return [item for chunk in workers.pool.map(fn, chunks) for item in chunk]
+
+
+class BatchImporter:
+    """
+    Imports batches as a pipeline: parse, resolve category/app IDs in bulk, hash rows on
+    the crypto pool, drop or redirect duplicates by fingerprint, encrypt and score the
+    rest on the pool, then write with one executemany per statement.
+    """
+
+    def __init__(self, db: Session, master_key: bytes, stats: ImportStats, duplicates: str = DUPLICATES_SKIP, key_version: Optional[int] = None):
+        self.db = db
+        self.key_version = keys.current_version(users.cache.load(db)) if key_version is None else key_version
+        self.rows = RowCrypto(master_key)
+        self.codec = self.rows.codec
+        self.stats = stats
+        self.duplicates = duplicates
+        # Resolved IDs, kept across batches
+        # Key: Name -> ID
+        self.category_cache = {}
+        # Key: (CategoryID, AppName) -> ID
+        self.app_cache = {}
+
+    def import_batch(self, rows: List[Tuple[int, dict]]):
+        db, stats = self.db, self.stats
+        # Held until the batch commits: the key must not be rotated in between
+        keys.check_write_version(db, self.key_version)
+
+        # 1. Parse
+        entries = []
+        for line, row in rows:
+            entry = parse_row(row)
+            if entry is None:
+                stats.add_error(line, "Missing application name or password")
+            else:
+                entries.append(entry)
+        if not entries:
+            return
+
+        # 2. Resolve categories and applications (created in bulk if missing)
+        new_cats = {e["category"]: "Imported via CSV" for e in entries if e["category"] not in self.category_cache}
+        if new_cats:
+            ids, _ = bulk.ensure_categories(db, new_cats)
+            self.category_cache.update(ids)
+        new_apps = {}
+        for e in entries:
+            key = (self.category_cache[e["category"]], e["app_name"])
+            if key not in self.app_cache:
+                new_apps.setdefault(key, e["description"])
+        if new_apps:
+            ids, _ = bulk.ensure_applications(db, new_apps, codec=self.codec)
+            self.app_cache.update(ids)
+
+        for e in entries:
+            e["application_id"] = self.app_cache[(self.category_cache[e["category"]], e["app_name"])]
+        digests = on_pool(self.rows.digest, [(e["application_id"], e["username"], e["password"]) for e in entries])
+        for e, (fingerprint, username_index) in zip(entries, digests):
+            e["fingerprint"], e["username_index"] = fingerprint, username_index
+
+        # 3. Duplicates
+        if self.duplicates == DUPLICATES_SKIP:
+            entries = self.skip_duplicates(entries)
+        elif self.duplicates == DUPLICATES_UPDATE:
+            entries = self.match_existing(entries)
+        if not entries:
+            return
+
+        # 4. Encrypt and audit, split across pool workers
+        now = datetime.datetime.utcnow()
+        sealed = on_pool(functools.partial(self.rows.seal, changed_at=now), [(e["username"], e["password"]) for e in entries])
+
+        # 5. Insert new entries, update matched ones (their username is unchanged)
+        inserts, updates = [], []
+        for e, values in zip(entries, sealed):
+            values["fingerprint"] = e["fingerprint"]
+            values["key_version"] = self.key_version
+            if e.get("existing_id"):
+                for name in ("username", "encrypted_username", "username_index"):
+                    del values[name]
+                values["b_id"] = e["existing_id"]
+                updates.append(values)
+            else:
+                values.update(id=uuid.uuid4(), application_id=e["application_id"], environment=e["environment"], created_at=now)
+                inserts.append(values)
+        table = models.PasswordEntry.__table__
+        if inserts:
+            db.execute(insert(table), inserts)
+        if updates:
+            db.execute(update(table).where(table.c.id == bindparam("b_id")), updates)
+        stats.success += len(entries)
+        stats.updated += len(updates)
+
+    def skip_duplicates(self, entries: List[dict]) -> List[dict]:
+        """Drops entries whose fingerprint is already stored (or repeated within the batch)."""
+        fingerprints = list({e["fingerprint"] for e in entries})
+        seen = set()
+        for chunk in bulk.chunked(fingerprints):
+            seen.update(self.db.execute(
+                select(models.PasswordEntry.fingerprint).where(models.PasswordEntry.fingerprint.in_(chunk))
+            ).scalars())
+        kept = []
+        for e in entries:
+            if e["fingerprint"] in seen:
+                self.stats.duplicates += 1
                 continue
+            seen.add(e["fingerprint"])
+            kept.append(e)
+        return kept
 
-            # --- Database Logic ---
-
-            # 1. Get/Create Category
-            cat_id = category_cache.get(cat_name)
-            if not cat_id:
-                new_cat = models.Category(name=cat_name, description="Imported via CSV")
-                db.add(new_cat)
-                db.flush() # Get ID
-                cat_id = new_cat.id
-                category_cache[cat_name] = cat_id
-
-            # 2. Get/Create Application
-            app_key = (cat_id, app_name)
-            app_id = app_cache.get(app_key)
-            if not app_id:
-                new_app = models.Application(name=app_name, description=full_description, category_id=cat_id)
-                db.add(new_app)
-                db.flush()
-                app_id = new_app.id
-                app_cache[app_key] = app_id
-
-            # 3. Create Password Entry
-            ciphertext, nonce = crypto.encrypt_password(raw_password, master_key)
-            
-            # Optional: Check if exact duplicate exists to avoid spamming? 
-            # For now, we trust the import action.
-
-            new_pw = models.PasswordEntry(
-                application_id=app_id,
-                username=username,
-                environment=env,
-                encrypted_password=ciphertext,
-                nonce=nonce
+    def match_existing(self, entries: List[dict]) -> List[dict]:
+        """
+        Points entries at the stored entry with the same application and username.
+        Usernames are compared by blind index, so this works when they are encrypted.
+        Identical ones (same fingerprint) are dropped; within the batch the last row wins.
+        """
+        table = models.PasswordEntry.__table__
+        app_ids = list({e["application_id"] for e in entries})
+        existing = {}
+        for chunk in bulk.chunked(app_ids):
+            rows = self.db.execute(
+                select(table.c.id, table.c.application_id, table.c.username, table.c.username_index, table.c.fingerprint)
+                .where(table.c.application_id.in_(chunk))
             )
-            db.add(new_pw)
-            success_count += 1
+            for entry_id, app_id, username, username_index, fingerprint in rows:
+                # Entries written before the index existed are still plaintext
+                if username_index is None:
+                    username_index = self.codec.username_index(username or "")
+                existing.setdefault((app_id, username_index), (entry_id, fingerprint))
 
-        except Exception as e:
-            # print(f"Error importing row: {e}") 
-            error_count += 1
-    
+        pending = {}
+        for e in entries:
+            key = (e["application_id"], e["username_index"])
+            if key in pending:
+                self.stats.duplicates += 1
+            match = existing.get(key)
+            if match and match[1] == e["fingerprint"]:
+                pending.pop(key, None)
+                self.stats.duplicates += 1
+                continue
+            e["existing_id"] = match[0] if match else None
+            pending[key] = e
+        return list(pending.values())
+
+def backfill_fingerprints(db: Session, master_key: bytes, batch_size: int = IMPORT_BATCH_SIZE, key_version: Optional[int] = None) -> int:
+    """
+    Computes fingerprints and username indexes for entries stored without them. Entries
+    that do not decrypt get UNREADABLE_FINGERPRINT, so later imports do not retry them.
+    key_version is the User.dek_version of master_key (default: the current one).
+    Returns the number of entries updated.
+    """
+    if key_version is None:
+        key_version = keys.current_version(users.cache.load(db))
+    index_key = crypto.derive_subkey(master_key, crypto.FINGERPRINT_KEY_PURPOSE)
+    cipher = keys.data_cipher(db, master_key)
+    codec = fields.FieldCodec(master_key, cipher)
+    table = models.PasswordEntry.__table__
+    total = 0
+    last_id = None
+    while True:
+        query = (
+            select(
+                table.c.id, table.c.application_id, table.c.username, table.c.encrypted_username,
+                table.c.encrypted_password, table.c.nonce
+            )
+            .where(or_(
+                table.c.fingerprint.is_(None),
+                and_(table.c.username_index.is_(None), table.c.username.is_not(None))
+            ))
+            .order_by(table.c.id)
+            .limit(batch_size)
+        )
+        if last_id is not None:
+            # Keyset paging (unreadable plaintext usernames would otherwise match again)
+            query = query.where(table.c.id > last_id)
+        rows = db.execute(query).all()
+        if not rows:
+            return total
+        last_id = rows[-1].id
+        plaintexts = cipher.decrypt_many([(r.encrypted_password, r.nonce) for r in rows])
+        updates = []
+        for r, plaintext in zip(rows, plaintexts):
+            if plaintext is None:
+                # Plaintext usernames are still indexed; sealed ones cannot be opened either
+                updates.append({"b_id": r.id, "fingerprint": UNREADABLE_FINGERPRINT, "username_index": codec.username_index(r.username)})
+                continue
+            username = codec.username(r.username, r.encrypted_username)
+            updates.append({
+                "b_id": r.id,
+                "fingerprint": crypto.entry_fingerprint(index_key, r.application_id, username or "", plaintext),
+                "username_index": codec.username_index(username)
+            })
+        db.execute(update(table).where(table.c.id == bindparam("b_id")), updates)
+        keys.check_write_version(db, key_version)
+        db.commit()
+        total += len(updates)
+
+def commit_batch(db: Session, stats: ImportStats, progress: Optional[Callable[[ImportStats], None]]):
     db.commit()
-    return success_count, error_count
+    stats.batches += 1
+    if progress:
+        progress(stats)
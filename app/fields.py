@@ -0,0 +1,65 @@
+"""
+Optional encryption of entry metadata at rest: PasswordEntry.username and
+Application.description. Sealed values live in encrypted_* columns (nonce || AES-GCM
+under the data key) and the plaintext columns stay NULL. Usernames also get a blind
+index, an HMAC under a key derived from the data key, so exact-match lookups and the
+import's duplicate matching remain indexed queries in either mode.
+
+Without the key the metadata endpoints return null for encrypted fields.
+POST /rotate/metadata converts existing rows after the setting changes.
+"""
+import hashlib
+import hmac
+import os
+from typing import Optional
+
+from . import crypto
+
+# Configuration
+ENCRYPT_METADATA = os.getenv("VAULT_ENCRYPT_METADATA", "false").lower() in ("1", "true", "yes")
+
+USERNAME_INDEX_PURPOSE = b"username-index"
+
+
+class FieldCodec:
+    """Reads and writes metadata columns for one data key, in the configured mode."""
+
+    def __init__(self, dek: bytes, cipher: Optional[crypto.CipherContext] = None, encrypt: Optional[bool] = None):
+        self.encrypt = ENCRYPT_METADATA if encrypt is None else encrypt
+        self.cipher = cipher or crypto.CipherContext(dek)
+        self.index_key = crypto.derive_subkey(dek, USERNAME_INDEX_PURPOSE)
+
+    def seal(self, value: Optional[str]) -> Optional[bytes]:
+        if value is None:
+            return None
+        ciphertext, nonce = self.cipher.encrypt(value)
+        return nonce + ciphertext
+
+    def open(self, sealed: Optional[bytes]) -> Optional[str]:
+        if sealed is None:
+            return None
+        return self.cipher.decrypt_many([(sealed[crypto.NONCE_LENGTH:], sealed[:crypto.NONCE_LENGTH])])[0]
+
+    def username_index(self, username: Optional[str]) -> Optional[bytes]:
+        """Blind index: equal usernames give equal values, nothing else is revealed."""
+        if username is None:
+            return None
+        return hmac.new(self.index_key, username.encode('utf-8'), hashlib.sha256).digest()
+
+    def username_values(self, username: Optional[str]) -> dict:
+        """Column values storing username."""
+        if self.encrypt:
+            return {"username": None, "encrypted_username": self.seal(username), "username_index": self.username_index(username)}
+        return {"username": username, "encrypted_username": None, "username_index": self.username_index(username)}
+
+    def description_values(self, description: Optional[str]) -> dict:
+        if self.encrypt:
+            return {"description": None, "encrypted_description": self.seal(description)}
+        return {"description": description, "encrypted_description": None}
+
+    def username(self, username: Optional[str], encrypted_username: Optional[bytes]) -> Optional[str]:
+        """Reads a username stored in either mode."""
+        return self.open(encrypted_username) if encrypted_username is not None else username
+
+    def description(self, description: Optional[str], encrypted_description: Optional[bytes]) -> Optional[str]:
+        return self.open(encrypted_description) if encrypted_description is not None else description
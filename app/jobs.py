@@ -0,0 +1,114 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+# Configuration
+# Background jobs (e.g. large imports) run on a small in-process pool, off the request threads.
+# Finished jobs stay queryable for JOB_RETENTION seconds.
+JOB_WORKERS = int(os.getenv("VAULT_JOB_WORKERS", "1"))
+JOB_RETENTION = int(os.getenv("VAULT_JOB_RETENTION", "3600"))
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class JobCancelled(Exception):
+    """Raised inside a job once cancellation has been requested."""
+
+
+class Job:
+    """State of one background job. The job function updates it while running."""
+
+    def __init__(self, kind: str, description: str = ""):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.description = description
+        self.state = QUEUED
+        self.error: Optional[str] = None
+        # Job-specific progress object (e.g. csv_utils.ImportStats)
+        self.progress = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._cancel = threading.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.state in (COMPLETED, FAILED, CANCELLED)
+
+    @property
+    def elapsed(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    def cancel(self):
+        """Requests cancellation; the job stops at its next check_cancelled() call."""
+        self._cancel.set()
+
+    def check_cancelled(self):
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+
+class JobRegistry:
+    def __init__(self, workers: int = JOB_WORKERS, retention: int = JOB_RETENTION):
+        self.retention = retention
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="vault-job")
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, job: Job, fn: Callable[[Job], None]) -> Job:
+        """
+        Queues fn(job) for execution and returns the job immediately.
+        fn should call job.check_cancelled() at safe points (including before starting work).
+        """
+        with self._lock:
+            self._purge()
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, fn)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def active(self, kind: str) -> List[Job]:
+        """Queued or running jobs of the given kind."""
+        with self._lock:
+            return [job for job in self._jobs.values() if job.kind == kind and not job.finished]
+
+    def shutdown(self):
+        with self._lock:
+            for job in self._jobs.values():
+                job.cancel()
+        self._executor.shutdown(wait=True)
+
+    def _run(self, job: Job, fn: Callable[[Job], None]):
+        job.started_at = time.time()
+        try:
+            job.state = RUNNING
+            fn(job)
+            job.state = COMPLETED
+        except JobCancelled:
+            job.state = CANCELLED
+        except Exception as e:
+            job.error = str(e)
+            job.state = FAILED
+        finally:
+            job.finished_at = time.time()
+
+    def _purge(self):
+        cutoff = time.time() - self.retention
+        expired = [job_id for job_id, job in self._jobs.items() if job.finished and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+registry = JobRegistry()
@@ -0,0 +1,360 @@
+"""
+Two-tier key hierarchy:
+
+    master password --Argon2id--> key-encryption key (KEK) --wraps--> data-encryption key (DEK)
+
+Entries are sealed with the DEK, so changing the master password only re-wraps the DEK.
+Rotating the DEK itself re-encrypts entries in the background, batch by batch; until
+that finishes the previous DEK stays available (wrapped with the new one) for reads.
+Vaults created before key wrapping have no wrapped DEK: their DEK is the KEK of the
+current password, and is wrapped as-is on the first password change.
+"""
+import datetime
+import os
+import time
+from typing import Callable, Optional
+
+from sqlalchemy import and_, bindparam, func, or_, select, update
+from sqlalchemy.orm import Session
+
+from . import audit, crypto, fields, models, users, workers
+
+# Configuration
+REENCRYPT_BATCH_SIZE = int(os.getenv("VAULT_REENCRYPT_BATCH_SIZE", "500"))
+# After a DEK rotation the previous DEK is kept at least this many seconds, so entries
+# committed by writers that unlocked just before it (e.g. with another worker's cached
+# user record) are still migrated.
+KEY_ROTATION_GRACE = float(os.getenv("VAULT_KEY_ROTATION_GRACE", str(users.USER_CACHE_TTL)))
+
+
+class KeyRotated(Exception):
+    """Raised when a write would seal data with a DEK that is no longer current."""
+
+
+class RotationInProgress(Exception):
+    """Raised by operations that need every entry on the current DEK (e.g. duplicate matching)."""
+
+
+class KeysChanged(Exception):
+    """Raised when the user row's keys changed after it was read (a concurrent rotation or password change)."""
+
+
+def current_version(user: Optional[users.UserRecord]) -> int:
+    return user.dek_version if user else 1
+
+def derive_kek(user: users.UserRecord, master_password: str) -> bytes:
+    return workers.derive_key(master_password, user.master_key_salt, user.kdf_params)
+
+def unwrap_dek(user: users.UserRecord, kek: bytes) -> bytes:
+    if user.wrapped_dek is None:
+        return kek
+    return crypto.unwrap_key(kek, user.wrapped_dek)
+
+def unlock(user: users.UserRecord, master_password: str) -> bytes:
+    """Returns the DEK. The caller must have verified master_password."""
+    return unwrap_dek(user, derive_kek(user, master_password))
+
+def check_write_version(db: Session, version: int):
+    """
+    Call in the transaction that writes data sealed with the DEK of the given version,
+    before committing. Raises KeyRotated if that DEK has been replaced. On PostgreSQL the
+    user row stays share-locked until commit, so a rotation cannot slip in between; on
+    SQLite the write transaction serializes with it instead.
+    """
+    current = db.execute(select(models.User.dek_version).with_for_update(read=True)).scalar()
+    if (current or 1) != version:
+        raise KeyRotated("The data key was rotated; unlock the vault again and retry")
+
+def check_not_rotating(db: Session):
+    """Raises RotationInProgress while entries are still being moved to a new DEK."""
+    user = users.cache.load(db)
+    if user and user.previous_wrapped_dek:
+        raise RotationInProgress("A data key rotation is in progress; retry once it has finished")
+
+def data_cipher(db: Session, dek: bytes) -> crypto.CipherContext:
+    """Cipher for reading entries: falls back to the previous DEK while a rotation is in progress."""
+    user = users.cache.get(db)
+    previous = []
+    if user and user.previous_wrapped_dek:
+        try:
+            previous.append(crypto.unwrap_key(dek, user.previous_wrapped_dek))
+        except ValueError:
+            pass  # dek is not the current key (e.g. another worker just rotated); entries will not open either
+    return crypto.CipherContext(dek, previous)
+
+def kek_columns(master_password: str, dek: bytes) -> dict:
+    """User column values wrapping dek with a fresh salt and the configured KDF parameters."""
+    salt = crypto.generate_salt()
+    params = crypto.KDF_PARAMS
+    return {
+        "master_key_salt": salt,
+        "wrapped_dek": crypto.wrap_key(workers.derive_key(master_password, salt, params), dek),
+        "kdf_time_cost": params.time_cost,
+        "kdf_memory_cost": params.memory_cost,
+        "kdf_parallelism": params.parallelism,
+    }
+
+def new_user_keys(master_password: str) -> dict:
+    """Column values for a new User: a fresh DEK wrapped with the password's KEK."""
+    return {**kek_columns(master_password, crypto.generate_data_key()), "dek_version": 1}
+
+def update_user(db: Session, user: users.UserRecord, values: dict, idle: bool = False) -> users.UserRecord:
+    """
+    Writes values to the user row if its keys are still those of user (same credential and
+    data key versions and salt), and with idle, no rotation is in progress. Otherwise raises
+    KeysChanged: concurrent rotations and password changes must not overwrite each other's
+    wrapped keys.
+    """
+    table = models.User.__table__
+    stmt = update(table).where(
+        table.c.id == user.id,
+        func.coalesce(table.c.dek_version, 1) == user.dek_version,
+        func.coalesce(table.c.credential_version, 1) == user.credential_version,
+        table.c.master_key_salt == user.master_key_salt
+    )
+    if idle:
+        stmt = stmt.where(table.c.previous_wrapped_dek.is_(None))
+    if db.execute(stmt.values(**values)).rowcount != 1:
+        db.rollback()
+        users.cache.invalidate()
+        raise KeysChanged("The vault keys were changed concurrently; unlock the vault again and retry")
+    users.generation.bump(db)  # commits
+    return users.cache.load(db)
+
+def change_master_password(db: Session, user: users.UserRecord, master_password: str, new_master_password: str) -> users.UserRecord:
+    """Re-wraps the DEK for a new password. No entry is touched."""
+    dek = unlock(user, master_password)
+    record = update_user(db, user, {
+        "password_hash": workers.hash_master_password(new_master_password),
+        "dek_version": user.dek_version,
+        "credential_version": user.credential_version + 1,
+        **kek_columns(new_master_password, dek)
+    })
+    # The cached KEK of the old password is useless now
+    crypto.key_cache.clear()
+    return record
+
+def upgrade_on_login(db: Session, user: users.UserRecord, master_password: str) -> users.UserRecord:
+    """
+    After a successful password check, moves the user onto the configured hasher and
+    KDF parameters: rehashes the password and/or re-wraps the DEK (entries are not touched).
+    """
+    values = {}
+    if crypto.needs_rehash(user.password_hash):
+        values["password_hash"] = workers.hash_master_password(master_password)
+    if user.kdf_params != crypto.KDF_PARAMS:
+        values.update(kek_columns(master_password, unlock(user, master_password)), dek_version=user.dek_version)
+    if not values:
+        return user
+    return update_user(db, user, values)
+
+def rotate_data_key(db: Session, user: users.UserRecord, master_password: str) -> users.UserRecord:
+    """
+    Installs a new DEK (version + 1) and keeps the old one wrapped with it.
+    Entries still sealed with the old DEK are migrated by reencrypt_entries().
+    """
+    if user.previous_wrapped_dek:
+        raise ValueError("A key rotation is still in progress")
+    kek = derive_kek(user, master_password)
+    old_dek = unwrap_dek(user, kek)
+    new_dek = crypto.generate_data_key()
+    # Conditional on the row still being the one the keys were read from: of two concurrent
+    # rotations only one commits, and the other's new DEK is never used
+    return update_user(db, user, {
+        "wrapped_dek": crypto.wrap_key(kek, new_dek),
+        "previous_wrapped_dek": crypto.wrap_key(new_dek, old_dek),
+        "dek_version": user.dek_version + 1,
+        "dek_rotated_at": datetime.datetime.utcnow()
+    }, idle=True)
+
+
+class ReencryptStats:
+    def __init__(self):
+        self.version = 0
+        self.entries = 0
+        self.failed = 0
+        self.batches = 0
+
+
+def reencrypt_entries(
+    db: Session,
+    dek: bytes,
+    batch_size: int = REENCRYPT_BATCH_SIZE,
+    progress: Optional[Callable[[ReencryptStats], None]] = None,
+    stats: Optional[ReencryptStats] = None,
+    grace: Optional[float] = None
+) -> ReencryptStats:
+    """
+    Re-seals every entry not yet on the current DEK, committing batch by batch, so it can
+    be stopped and started again at any point. Encrypted metadata is re-sealed and the
+    username index recomputed along the way.
+
+    The previous DEK is only dropped once grace seconds (KEY_ROTATION_GRACE) have passed
+    since the rotation and a final check, in the same transaction, finds no entry left on
+    it; passes repeat until then. Entries that open under neither key are counted as
+    failed and left as they are (keeping the previous key would not make them readable).
+    """
+    stats = stats or ReencryptStats()
+    grace = KEY_ROTATION_GRACE if grace is None else grace
+    user = users.cache.load(db)
+    stats.version = current_version(user)
+    cipher = data_cipher(db, dek)
+    codec = fields.FieldCodec(dek, cipher)
+    table = models.PasswordEntry.__table__
+    stale = or_(table.c.key_version.is_(None), table.c.key_version != stats.version)
+    unreadable = set()
+
+    while True:
+        reencrypt_pass(db, dek, cipher, codec, stale, batch_size, progress, stats, unreadable)
+        if user and user.previous_wrapped_dek and wait_for_grace(user, grace, progress, stats):
+            continue  # writers may have committed with the previous key meanwhile
+        stats.failed = len(unreadable)
+        apps = models.Application.__table__
+        rewrite_descriptions(db, codec, apps.c.encrypted_description.is_not(None), batch_size, stats)
+        if not (user and user.previous_wrapped_dek):
+            return stats
+
+        # Block writers (they share-lock the user row) while checking nothing is left; the
+        # row is re-read as a password change may have re-wrapped the key meanwhile
+        locked = db.execute(
+            select(models.User).with_for_update().execution_options(populate_existing=True)
+        ).scalar()
+        if set(db.execute(select(table.c.id).where(stale)).scalars()) <= unreadable:
+            update_user(db, users.UserRecord.from_model(locked), {"previous_wrapped_dek": None})
+            return stats
+        db.rollback()
+
+def wait_for_grace(user: users.UserRecord, grace: float, progress, stats: ReencryptStats) -> bool:
+    """Sleeps until grace seconds after the rotation, calling progress every second. Returns whether it slept."""
+    if user.dek_rotated_at is None:
+        return False
+    deadline = user.dek_rotated_at + datetime.timedelta(seconds=grace)
+    slept = False
+    while True:
+        remaining = (deadline - datetime.datetime.utcnow()).total_seconds()
+        if remaining <= 0:
+            return slept
+        time.sleep(min(remaining, 1.0))
+        slept = True
+        if progress:
+            progress(stats)
+
+def reencrypt_pass(db: Session, dek: bytes, cipher: crypto.CipherContext, codec: fields.FieldCodec, stale, batch_size: int, progress, stats: ReencryptStats, unreadable: set):
+    """One keyset pass over the entries matching stale; IDs that fail to open are added to unreadable."""
+    auditor = audit.Auditor(dek)
+    index_key = crypto.derive_subkey(dek, crypto.FINGERPRINT_KEY_PURPOSE)
+    table = models.PasswordEntry.__table__
+    last_id = None
+    while True:
+        query = (
+            select(
+                table.c.id, table.c.application_id, table.c.username, table.c.encrypted_username,
+                table.c.encrypted_password, table.c.nonce
+            )
+            .where(stale)
+            .order_by(table.c.id)
+            .limit(batch_size)
+        )
+        if last_id is not None:
+            query = query.where(table.c.id > last_id)
+        rows = db.execute(query).all()
+        if not rows:
+            return
+        last_id = rows[-1].id
+
+        plaintexts = cipher.decrypt_many([(r.encrypted_password, r.nonce) for r in rows])
+        opened = [(r, p, codec.username(r.username, r.encrypted_username)) for r, p in zip(rows, plaintexts) if p is not None]
+        unreadable.update(r.id for r, p in zip(rows, plaintexts) if p is None)
+        if opened:
+            sealed = cipher.encrypt_many([p for _, p, _ in opened])
+            db.execute(update(table).where(table.c.id == bindparam("b_id")), [
+                {
+                    "b_id": r.id,
+                    "encrypted_password": ciphertext,
+                    "nonce": nonce,
+                    "key_version": stats.version,
+                    # Fingerprints and the username index are keyed by the DEK as well
+                    "fingerprint": crypto.entry_fingerprint(index_key, r.application_id, username or "", p),
+                    "reuse_fingerprint": auditor.reuse_fingerprint(p),
+                    **codec.username_values(username)
+                }
+                for (r, p, username), (ciphertext, nonce) in zip(opened, sealed)
+            ])
+        db.commit()
+        stats.entries += len(opened)
+        stats.batches += 1
+        if progress:
+            progress(stats)
+
+def rewrite_descriptions(db: Session, codec: fields.FieldCodec, where, batch_size: int, stats: ReencryptStats):
+    """Stores the descriptions of the applications matching where through codec, batch by batch."""
+    table = models.Application.__table__
+    last_id = None
+    while True:
+        query = select(table.c.id, table.c.description, table.c.encrypted_description).where(where).order_by(table.c.id).limit(batch_size)
+        if last_id is not None:
+            query = query.where(table.c.id > last_id)
+        rows = db.execute(query).all()
+        if not rows:
+            return
+        last_id = rows[-1].id
+        updates = []
+        for r in rows:
+            description = codec.description(r.description, r.encrypted_description)
+            if description is None and r.encrypted_description is not None:
+                stats.failed += 1
+                continue
+            updates.append({"b_id": r.id, **codec.description_values(description)})
+        if updates:
+            db.execute(update(table).where(table.c.id == bindparam("b_id")), updates)
+        db.commit()
+        stats.batches += 1
+
+def convert_metadata(
+    db: Session,
+    dek: bytes,
+    batch_size: int = REENCRYPT_BATCH_SIZE,
+    progress: Optional[Callable[[ReencryptStats], None]] = None,
+    stats: Optional[ReencryptStats] = None
+) -> ReencryptStats:
+    """
+    Moves usernames and application descriptions to the configured storage mode
+    (fields.ENCRYPT_METADATA) and fills in missing username indexes. Resumable like
+    reencrypt_entries(); passwords are not touched.
+    """
+    stats = stats or ReencryptStats()
+    stats.version = current_version(users.cache.load(db))
+    codec = fields.FieldCodec(dek, data_cipher(db, dek))
+    table = models.PasswordEntry.__table__
+    if codec.encrypt:
+        pending = or_(table.c.username.is_not(None), and_(table.c.username_index.is_(None), table.c.encrypted_username.is_not(None)))
+    else:
+        pending = or_(table.c.encrypted_username.is_not(None), and_(table.c.username_index.is_(None), table.c.username.is_not(None)))
+
+    last_id = None
+    while True:
+        query = select(table.c.id, table.c.username, table.c.encrypted_username).where(pending).order_by(table.c.id).limit(batch_size)
+        if last_id is not None:
+            query = query.where(table.c.id > last_id)
+        rows = db.execute(query).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        updates = []
+        for r in rows:
+            username = codec.username(r.username, r.encrypted_username)
+            if username is None and r.encrypted_username is not None:
+                stats.failed += 1
+                continue
+            updates.append({"b_id": r.id, **codec.username_values(username)})
+        if updates:
+            db.execute(update(table).where(table.c.id == bindparam("b_id")), updates)
+        db.commit()
+        stats.entries += len(updates)
+        stats.batches += 1
+        if progress:
+            progress(stats)
+
+    apps = models.Application.__table__
+    rewrite_descriptions(db, codec, (apps.c.description if codec.encrypt else apps.c.encrypted_description).is_not(None), batch_size, stats)
+    return stats
@@ -1,15 +1,25 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Body
+from fastapi import FastAPI, Depends, HTTPException, status, Body, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import List
+from sqlalchemy import func, select, tuple_
+from typing import List, Optional
+from pydantic import TypeAdapter
 from uuid import UUID
 
-from . import models, schemas, database, crypto, csv_utils
+from . import models, schemas, database, crypto, csv_utils, sessions, workers, migrations, bulk, jobs, users, cache, keys, fields, search, audit
+import base64
 import csv
+import datetime
+import hashlib
 import io
-from fastapi.responses import StreamingResponse
+import json
+import os
+import shutil
+import tempfile
+from fastapi.responses import JSONResponse, StreamingResponse
+import orjson
 
 app = FastAPI(title="Secure Password Vault v2")
 
@@ -20,6 +30,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Total-Count", "X-Next-Cursor"],
 )
 
 # Static Files
@@ -29,6 +40,36 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 def startup_event():
     database.wait_for_db()
     models.Base.metadata.create_all(bind=database.engine)
+    migrations.upgrade(database.engine)
+    with database.SessionLocal() as db:
+        users.cache.load(db)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    jobs.registry.shutdown()
+    search.purges.flush()
+    workers.pool.shutdown()
+    await database.dispose_async_engine()
+
+@app.exception_handler(workers.PoolSaturated)
+def crypto_pool_saturated(request, exc):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Server busy, please retry"},
+        headers={"Retry-After": str(workers.RETRY_AFTER)}
+    )
+
+@app.exception_handler(keys.KeyRotated)
+def data_key_rotated(request, exc):
+    return JSONResponse(status_code=409, content={"detail": str(exc)})
+
+@app.exception_handler(keys.KeysChanged)
+def user_keys_changed(request, exc):
+    return JSONResponse(status_code=409, content={"detail": str(exc)})
+
+@app.exception_handler(keys.RotationInProgress)
+def data_key_rotating(request, exc):
+    return JSONResponse(status_code=409, content={"detail": str(exc)})
 
 from fastapi.responses import FileResponse
 
@@ -41,18 +82,90 @@ def read_ui():
     return FileResponse('static/index.html')
 
 @app.get("/status")
-def get_status(db: Session = Depends(database.get_db)):
-    user = db.query(models.User).first()
-    return {"initialized": bool(user)}
+async def get_status(db: AsyncSession = Depends(database.get_async_db)):
+    return {"initialized": await users.cache.get_async(db) is not None}
+
+def etag_response(request: Request, body: bytes, media_type: str = "application/json") -> Response:
+    """Returns body with a strong ETag, or an empty 304 if the client already has it."""
+    etag = '"%s"' % hashlib.sha256(body).hexdigest()[:32]
+    return cached_response(request, cache.CachedResponse(body, etag, {}), media_type)
+
+def cached_response(request: Request, cached: cache.CachedResponse, media_type: str = "application/json") -> Response:
+    if cached.etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers={"ETag": cached.etag})
+    return Response(content=cached.body, media_type=media_type, headers={"ETag": cached.etag, **cached.headers})
+
+# --- LIST SERIALIZATION ---
+# List endpoints select just the response schema's columns and encode the row tuples
+# with orjson, skipping ORM hydration and per-row Pydantic validation.
+def response_columns(model, schema) -> list:
+    return [getattr(model, name) for name in schema.model_fields]
+
+def rows_json(keys, rows) -> bytes:
+    keys = list(keys)
+    return orjson.dumps([dict(zip(keys, row)) for row in rows])
+
+CATEGORY_COLUMNS = response_columns(models.Category, schemas.CategoryResponse)
+APPLICATION_COLUMNS = response_columns(models.Application, schemas.ApplicationResponse)
+PASSWORD_COLUMNS = response_columns(models.PasswordEntry, schemas.PasswordEntryResponse)
 
 # --- AUTH HELPERS ---
-def verify_mp(db: Session, mp: str):
-    user = db.query(models.User).first()
+def verify_mp(db: Session, mp: str) -> users.UserRecord:
+    user = users.cache.current(db)
     if not user:
         raise HTTPException(status_code=400, detail="System not initialized")
-    if not crypto.verify_master_password(mp, user.password_hash):
-        raise HTTPException(status_code=401, detail="Invalid Master Password")
-    return user
+    if not workers.verify_master_password(mp, user.password_hash):
+        # The hash may have been changed by another worker since it was cached
+        current = users.cache.load(db)
+        if not current or current.password_hash == user.password_hash or not workers.verify_master_password(mp, current.password_hash):
+            raise HTTPException(status_code=401, detail="Invalid Master Password")
+        user = current
+    return keys.upgrade_on_login(db, user, mp)
+
+def authorize(db: Session, mp: Optional[str] = None, token: Optional[str] = None, need_key: bool = False):
+    """
+    Accepts either an unlocked session token or the master password.
+    Returns (user_id, master_key); master_key is the data-encryption key, and is None
+    unless need_key is set or the caller authenticated with a session token.
+    """
+    user_id, master_key, _ = authorize_key(db, mp, token, need_key)
+    return user_id, master_key
+
+def authorize_key(db: Session, mp: Optional[str] = None, token: Optional[str] = None, need_key: bool = True):
+    """
+    authorize() that also returns the User.dek_version of master_key, for handlers that
+    seal data with it (see keys.check_write_version).
+    """
+    if token:
+        session = sessions.store.get(token)
+        user = users.cache.current(db) if session else None
+        if not user or (session.key_version, session.credential_version) != (user.dek_version, user.credential_version):
+            raise HTTPException(status_code=401, detail="Session expired or locked")
+        return session.user_id, session.master_key, session.key_version
+    if not mp:
+        raise HTTPException(status_code=401, detail="Master password or session token required")
+    user = verify_mp(db, mp)
+    master_key = keys.unlock(user, mp) if need_key else None
+    return user.id, master_key, user.dek_version
+
+# --- SESSIONS ---
+@app.post("/unlock", response_model=schemas.UnlockResponse)
+def unlock(req: schemas.UnlockRequest, db: Session = Depends(database.get_db)):
+    """Verifies the master password once and returns a short-lived session token."""
+    user = verify_mp(db, req.master_password)
+    master_key = keys.unlock(user, req.master_password)
+    session = sessions.store.open(user.id, master_key, user.dek_version, user.credential_version)
+    return schemas.UnlockResponse(
+        session_token=session.token,
+        expires_in=sessions.store.expires_in(session),
+        idle_timeout=sessions.store.idle_timeout
+    )
+
+@app.post("/lock")
+def lock(req: schemas.LockRequest):
+    if not sessions.store.close(req.session_token):
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {"message": "Vault locked"}
 
 # --- SETUP ---
 @app.post("/setup", response_model=schemas.UserResponse)
@@ -60,23 +173,23 @@ def setup_system(user: schemas.UserCreate, db: Session = Depends(database.get_db
     if db.query(models.User).first():
         raise HTTPException(status_code=400, detail="System already initialized")
     
-    salt = crypto.generate_salt()
-    pw_hash = crypto.hash_master_password(user.master_password)
+    pw_hash = workers.hash_master_password(user.master_password)
     
     db_user = models.User(
         username=user.username,
         password_hash=pw_hash,
-        master_key_salt=salt
+        **keys.new_user_keys(user.master_password)
     )
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
+    users.cache.set(users.UserRecord.from_model(db_user))
     return db_user
 
 # --- CATEGORIES ---
 @app.post("/categories", response_model=schemas.CategoryResponse)
 def create_category(cat: schemas.CategoryCreate, db: Session = Depends(database.get_db)):
-    verify_mp(db, cat.master_password)
+    authorize(db, cat.master_password, cat.session_token)
     
     # Check duplicate
     if db.query(models.Category).filter(models.Category.name == cat.name).first():
@@ -85,16 +198,21 @@ def create_category(cat: schemas.CategoryCreate, db: Session = Depends(database.
     new_cat = models.Category(name=cat.name, description=cat.description)
     db.add(new_cat)
     db.commit()
+    cache.listings.invalidate(db)
     db.refresh(new_cat)
     return new_cat
 
 @app.get("/categories", response_model=List[schemas.CategoryResponse])
-def get_categories(db: Session = Depends(database.get_db)):
-    return db.query(models.Category).all()
+async def get_categories(request: Request, db: AsyncSession = Depends(database.get_async_db)):
+    generation, cached = await cache.listings.lookup(db, "categories")
+    if cached is None:
+        result = await db.execute(select(*CATEGORY_COLUMNS))
+        cached = cache.listings.store("categories", generation, rows_json(result.keys(), result))
+    return cached_response(request, cached)
 
 @app.put("/categories/{cat_id}", response_model=schemas.CategoryResponse)
-def update_category(cat_id: UUID, cat: schemas.CategoryBase, master_password: str = Body(...), db: Session = Depends(database.get_db)):
-    verify_mp(db, master_password)
+def update_category(cat_id: UUID, cat: schemas.CategoryUpdate, db: Session = Depends(database.get_db)):
+    authorize(db, cat.master_password, cat.session_token)
     db_cat = db.query(models.Category).filter(models.Category.id == cat_id).first()
     if not db_cat:
         raise HTTPException(status_code=404, detail="Category not found")
@@ -102,46 +220,169 @@ def update_category(cat_id: UUID, cat: schemas.CategoryBase, master_password: st
     db_cat.name = cat.name
     db_cat.description = cat.description
     db.commit()
+    cache.listings.invalidate(db)
     db.refresh(db_cat)
     return db_cat
 
 @app.delete("/categories/{cat_id}")
 def delete_category(cat_id: UUID, req: schemas.DeleteRequest, db: Session = Depends(database.get_db)):
-    verify_mp(db, req.master_password)
+    authorize(db, req.master_password, req.session_token)
     db_cat = db.query(models.Category).filter(models.Category.id == cat_id).first()
     if not db_cat:
         raise HTTPException(status_code=404, detail="Category not found")
     
     db.delete(db_cat)
     db.commit()
+    cache.listings.invalidate(db)
+    search.purges.request(db.get_bind(), ["category", "application", "password"])
     return {"message": "Category deleted"}
 
+# --- HIERARCHY ---
+tree_adapter = TypeAdapter(List[schemas.CategoryWithApps])
+
+@app.get("/tree", response_model=List[schemas.CategoryWithApps])
+def get_tree(request: Request, db: Session = Depends(database.get_db)):
+    """Categories -> applications -> password counts, in one query."""
+    counts = (
+        select(models.PasswordEntry.application_id, func.count().label("password_count"))
+        .group_by(models.PasswordEntry.application_id)
+        .subquery()
+    )
+    rows = db.execute(
+        select(
+            models.Category.id.label("category_id"),
+            models.Category.name.label("category_name"),
+            models.Category.description.label("category_description"),
+            models.Application.id.label("app_id"),
+            models.Application.name.label("app_name"),
+            models.Application.description.label("app_description"),
+            func.coalesce(counts.c.password_count, 0).label("password_count")
+        )
+        .select_from(models.Category)
+        .outerjoin(models.Application, models.Application.category_id == models.Category.id)
+        .outerjoin(counts, counts.c.application_id == models.Application.id)
+        .order_by(models.Category.name, models.Application.name)
+    )
+
+    tree = []
+    for r in rows:
+        if not tree or tree[-1].id != r.category_id:
+            tree.append(schemas.CategoryWithApps(id=r.category_id, name=r.category_name, description=r.category_description))
+        if r.app_id is not None:
+            tree[-1].applications.append(schemas.ApplicationWithCount(
+                id=r.app_id,
+                name=r.app_name,
+                description=r.app_description,
+                category_id=r.category_id,
+                password_count=r.password_count
+            ))
+    return etag_response(request, tree_adapter.dump_json(tree))
+
 # --- APPLICATIONS ---
+def check_app_name_free(db: Session, category_id: UUID, name: str, exclude_id: Optional[UUID] = None):
+    q = db.query(models.Application.id).filter(models.Application.category_id == category_id, models.Application.name == name)
+    if exclude_id:
+        q = q.filter(models.Application.id != exclude_id)
+    if q.first():
+        raise HTTPException(status_code=400, detail="Application already exists in this category")
+
+def description_values(master_key: Optional[bytes], description: Optional[str]) -> dict:
+    """Application description columns; with metadata encryption master_key is required."""
+    if not fields.ENCRYPT_METADATA:
+        return {"description": description, "encrypted_description": None}
+    return fields.FieldCodec(master_key).description_values(description)
+
+def application_response(app: models.Application, description: Optional[str]) -> schemas.ApplicationResponse:
+    # The stored description may be sealed; echo the caller's plaintext
+    return schemas.ApplicationResponse(id=app.id, name=app.name, description=description, category_id=app.category_id)
+
 @app.post("/applications", response_model=schemas.ApplicationResponse)
 def create_application(app_in: schemas.ApplicationCreate, db: Session = Depends(database.get_db)):
-    verify_mp(db, app_in.master_password)
+    _, master_key, key_version = authorize_key(db, app_in.master_password, app_in.session_token, need_key=fields.ENCRYPT_METADATA)
     
     # Check category exists
     cat = db.query(models.Category).filter(models.Category.id == app_in.category_id).first()
     if not cat:
         raise HTTPException(status_code=400, detail="Invalid Category ID")
+    check_app_name_free(db, app_in.category_id, app_in.name)
 
-    new_app = models.Application(name=app_in.name, description=app_in.description, category_id=app_in.category_id)
+    new_app = models.Application(name=app_in.name, category_id=app_in.category_id, **description_values(master_key, app_in.description))
     db.add(new_app)
+    if fields.ENCRYPT_METADATA:
+        keys.check_write_version(db, key_version)
     db.commit()
+    cache.listings.invalidate(db)
     db.refresh(new_app)
-    return new_app
+    return application_response(new_app, app_in.description)
+
+def encode_cursor(name: str, app_id: UUID) -> str:
+    return base64.urlsafe_b64encode(json.dumps([name, str(app_id)]).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor: str):
+    try:
+        name, app_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return name, UUID(app_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+APPLICATIONS_PAGE_SIZE = 100
 
 @app.get("/applications", response_model=List[schemas.ApplicationResponse])
-def get_applications(category_id: UUID = None, db: Session = Depends(database.get_db)):
-    q = db.query(models.Application)
+async def get_applications(
+    request: Request,
+    category_id: UUID = None,
+    q: Optional[str] = None,
+    match: str = Query("substring", pattern="^(substring|prefix)$"),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(database.get_async_db)
+):
+    """
+    Lists applications ordered by name, filtered by category and/or a case-insensitive
+    name search. Keyset-paginated when limit or cursor is given (a cursor alone uses
+    pages of APPLICATIONS_PAGE_SIZE): pass the X-Next-Cursor header back as ?cursor=.
+    Without either, every match is returned. X-Total-Count carries the number of
+    matches across all pages.
+    """
+    if cursor and limit is None:
+        limit = APPLICATIONS_PAGE_SIZE
+    key = ("applications", category_id, q, match, limit, cursor)
+    generation, cached = await cache.listings.lookup(db, key)
+    if cached is not None:
+        return cached_response(request, cached)
+
+    filters = []
     if category_id:
-        q = q.filter(models.Application.category_id == category_id)
-    return q.all()
+        filters.append(models.Application.category_id == category_id)
+    if q:
+        escaped = q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        pattern = f"{escaped}%" if match == "prefix" else f"%{escaped}%"
+        if db.bind.dialect.name == "sqlite":
+            # SQLite's LIKE is already case-insensitive and can use the NOCASE index
+            filters.append(models.Application.name.like(pattern, escape="\\"))
+        else:
+            filters.append(models.Application.name.ilike(pattern, escape="\\"))
+
+    total = (await db.execute(select(func.count(models.Application.id)).where(*filters))).scalar()
+
+    page = select(*APPLICATION_COLUMNS).where(*filters)
+    if cursor:
+        last_name, last_id = decode_cursor(cursor)
+        page = page.where(tuple_(models.Application.name, models.Application.id) > (last_name, last_id))
+    page = page.order_by(models.Application.name, models.Application.id)
+    result = await db.execute(page if limit is None else page.limit(limit + 1))
+    keys, apps = result.keys(), result.all()
+
+    headers = {"X-Total-Count": str(total)}
+    if limit is not None and len(apps) > limit:
+        apps = apps[:limit]
+        headers["X-Next-Cursor"] = encode_cursor(apps[-1].name, apps[-1].id)
+    cached = cache.listings.store(key, generation, rows_json(keys, apps), headers)
+    return cached_response(request, cached)
 
 @app.put("/applications/{app_id}", response_model=schemas.ApplicationResponse)
 def update_application(app_id: UUID, app_in: schemas.ApplicationUpdate, db: Session = Depends(database.get_db)):
-    verify_mp(db, app_in.master_password)
+    _, master_key, key_version = authorize_key(db, app_in.master_password, app_in.session_token, need_key=fields.ENCRYPT_METADATA)
     app = db.query(models.Application).filter(models.Application.id == app_id).first()
     if not app:
         raise HTTPException(status_code=404, detail="Application not found")
@@ -150,100 +391,222 @@ def update_application(app_id: UUID, app_in: schemas.ApplicationUpdate, db: Sess
     if app.category_id != app_in.category_id:
          if not db.query(models.Category).filter(models.Category.id == app_in.category_id).first():
              raise HTTPException(status_code=400, detail="Invalid Category ID")
+    check_app_name_free(db, app_in.category_id, app_in.name, exclude_id=app_id)
 
     app.name = app_in.name
-    app.description = app_in.description
+    for name, value in description_values(master_key, app_in.description).items():
+        setattr(app, name, value)
     app.category_id = app_in.category_id
+    if fields.ENCRYPT_METADATA:
+        keys.check_write_version(db, key_version)
     db.commit()
+    cache.listings.invalidate(db)
     db.refresh(app)
-    return app
+    return application_response(app, app_in.description)
 
 @app.delete("/applications/{app_id}")
 def delete_application(app_id: UUID, req: schemas.DeleteRequest, db: Session = Depends(database.get_db)):
-    verify_mp(db, req.master_password)
+    authorize(db, req.master_password, req.session_token)
     db_app = db.query(models.Application).filter(models.Application.id == app_id).first()
     if not db_app:
         raise HTTPException(status_code=404, detail="Application not found")
     db.delete(db_app)
     db.commit()
+    cache.listings.invalidate(db)
+    search.purges.request(db.get_bind(), ["application", "password"])
     return {"message": "Application deleted"}
 
 
 # --- PASSWORDS ---
 @app.post("/passwords", response_model=schemas.PasswordEntryResponse)
 def create_password(pw_in: schemas.PasswordEntryCreate, db: Session = Depends(database.get_db)):
-    user = verify_mp(db, pw_in.master_password) # Returns User obj
+    _, master_key, key_version = authorize_key(db, pw_in.master_password, pw_in.session_token)
     
     # Verify App exists
     if not db.query(models.Application).filter(models.Application.id == pw_in.application_id).first():
         raise HTTPException(status_code=400, detail="Invalid Application ID")
 
     # Encrypt
-    master_key = crypto.derive_key(pw_in.master_password, user.master_key_salt)
-    ciphertext, nonce = crypto.encrypt_password(pw_in.plaintext_password, master_key)
+    cipher = crypto.CipherContext(master_key)
+    ciphertext, nonce = workers.pool.run(cipher.encrypt, pw_in.plaintext_password)
+    index_key = crypto.derive_subkey(master_key, crypto.FINGERPRINT_KEY_PURPOSE)
 
     new_pw = models.PasswordEntry(
         application_id=pw_in.application_id,
-        username=pw_in.username,
+        **fields.FieldCodec(master_key, cipher).username_values(pw_in.username),
         environment=pw_in.environment,
         encrypted_password=ciphertext,
-        nonce=nonce
+        nonce=nonce,
+        fingerprint=crypto.entry_fingerprint(index_key, pw_in.application_id, pw_in.username or "", pw_in.plaintext_password),
+        key_version=key_version,
+        **audit.Auditor(master_key).values(pw_in.plaintext_password)
     )
     db.add(new_pw)
+    keys.check_write_version(db, key_version)
     db.commit()
     db.refresh(new_pw)
-    return new_pw
+    return schemas.PasswordEntryResponse(
+        id=new_pw.id,
+        application_id=new_pw.application_id,
+        username=pw_in.username,
+        environment=new_pw.environment,
+        created_at=new_pw.created_at
+    )
 
 @app.get("/applications/{app_id}/passwords", response_model=List[schemas.PasswordEntryResponse])
-def get_passwords_for_app(app_id: UUID, db: Session = Depends(database.get_db)):
+async def get_passwords_for_app(app_id: UUID, db: AsyncSession = Depends(database.get_async_db)):
     """Get metadata only for passwords in an app."""
-    return db.query(models.PasswordEntry).filter(models.PasswordEntry.application_id == app_id).all()
+    result = await db.execute(select(*PASSWORD_COLUMNS).where(models.PasswordEntry.application_id == app_id))
+    return Response(content=rows_json(result.keys(), result), media_type="application/json")
+
+@app.post("/audit", response_model=schemas.AuditReport)
+def audit_report(req: schemas.AuditRequest, db: Session = Depends(database.get_db)):
+    """
+    Reused, weak and stale passwords. Results are maintained as entries are written;
+    only entries stored before the audit existed are decrypted here, once.
+    """
+    _, master_key = authorize(db, req.master_password, req.session_token, need_key=True)
+    cipher = keys.data_cipher(db, master_key)
+    audit.refresh(db, master_key, cipher)
+    return audit.report(db, fields.FieldCodec(master_key, cipher), req.limit)
+
+@app.get("/search", response_model=List[schemas.SearchHit])
+async def search_metadata(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=1000),
+    db: AsyncSession = Depends(database.get_async_db)
+):
+    """
+    Ranked full-text search over category/application names and descriptions and entry
+    usernames/environments; every word must match as a prefix. Pass the X-Next-Offset
+    header back as ?offset= for the next page.
+    """
+    hits, more = await search.search(db, q, limit, offset)
+    headers = {"X-Next-Offset": str(offset + limit)} if more else {}
+    return Response(content=rows_json(search.SearchHit._fields, hits), media_type="application/json", headers=headers)
 
 @app.post("/passwords/decrypt", response_model=schemas.PasswordEntryDecryptedResponse)
 def decrypt_password(
     entry_id: UUID = Body(...), 
-    master_password: str = Body(...), 
+    master_password: Optional[str] = Body(None), 
+    session_token: Optional[str] = Body(None),
     db: Session = Depends(database.get_db)
 ):
-    user = verify_mp(db, master_password)
+    _, master_key = authorize(db, master_password, session_token, need_key=True)
     
     item = db.query(models.PasswordEntry).filter(models.PasswordEntry.id == entry_id).first()
     if not item:
         raise HTTPException(status_code=404, detail="Entry not found")
-
-    master_key = crypto.derive_key(master_password, user.master_key_salt)
     
+    cipher = keys.data_cipher(db, master_key)
     try:
-        plaintext = crypto.decrypt_password(item.encrypted_password, item.nonce, master_key)
-    except Exception:
+        plaintext = workers.pool.run(cipher.decrypt, item.encrypted_password, item.nonce)
+    except ValueError:
         raise HTTPException(status_code=500, detail="Decryption Failed")
     
     return schemas.PasswordEntryDecryptedResponse(
          id=item.id,
          application_id=item.application_id,
-         username=item.username,
+         username=fields.FieldCodec(master_key, cipher).username(item.username, item.encrypted_username),
          environment=item.environment,
          created_at=item.created_at,
          decrypted_password=plaintext
     )
 
+@app.post("/passwords/lookup", response_model=List[schemas.PasswordEntryResponse])
+def lookup_passwords(req: schemas.UsernameLookup, db: Session = Depends(database.get_db)):
+    """
+    Entries whose username is exactly req.username, found through the blind index, so
+    this stays an indexed query when usernames are encrypted.
+    """
+    _, master_key = authorize(db, req.master_password, req.session_token, need_key=True)
+    codec = fields.FieldCodec(master_key, keys.data_cipher(db, master_key))
+    stmt = (
+        select(*PASSWORD_COLUMNS, models.PasswordEntry.encrypted_username)
+        .where(models.PasswordEntry.username_index == codec.username_index(req.username))
+        .order_by(models.PasswordEntry.created_at)
+    )
+    if req.application_id is not None:
+        stmt = stmt.where(models.PasswordEntry.application_id == req.application_id)
+    return [
+        schemas.PasswordEntryResponse(
+            id=r.id,
+            application_id=r.application_id,
+            username=codec.username(r.username, r.encrypted_username),
+            environment=r.environment,
+            created_at=r.created_at
+        )
+        for r in db.execute(stmt)
+    ]
+
+# Entries are decrypted in chunks so the first results stream out while the rest are processed
+DECRYPT_CHUNK_SIZE = 100
+
+@app.post("/passwords/decrypt/batch")
+def decrypt_passwords_batch(req: schemas.PasswordBatchDecryptRequest, db: Session = Depends(database.get_db)):
+    """
+    Decrypts many entries (by ID list or whole application) with one key derivation.
+    Streams NDJSON: one object per entry, with an "error" field instead of the password on failure.
+    """
+    if (req.entry_ids is None) == (req.application_id is None):
+        raise HTTPException(status_code=400, detail="Provide either entry_ids or application_id")
+    _, master_key = authorize(db, req.master_password, req.session_token, need_key=True)
+    cipher = keys.data_cipher(db, master_key)
+    codec = fields.FieldCodec(master_key, cipher)
+
+    q = db.query(models.PasswordEntry)
+    if req.entry_ids is not None:
+        q = q.filter(models.PasswordEntry.id.in_(req.entry_ids))
+    else:
+        q = q.filter(models.PasswordEntry.application_id == req.application_id)
+    items = q.order_by(models.PasswordEntry.created_at).all()
+    missing = []
+    if req.entry_ids is not None:
+        found = {item.id for item in items}
+        missing = [entry_id for entry_id in dict.fromkeys(req.entry_ids) if entry_id not in found]
+
+    def generate():
+        for entry_id in missing:
+            yield json.dumps({"id": str(entry_id), "error": "Entry not found"}) + "\n"
+        for start in range(0, len(items), DECRYPT_CHUNK_SIZE):
+            chunk = items[start:start + DECRYPT_CHUNK_SIZE]
+            plaintexts = workers.pool.submit(
+                cipher.decrypt_many, [(i.encrypted_password, i.nonce) for i in chunk], wait=True
+            ).result()
+            for item, plaintext in zip(chunk, plaintexts):
+                if plaintext is None:
+                    yield json.dumps({"id": str(item.id), "error": "Decryption Failed"}) + "\n"
+                    continue
+                yield schemas.PasswordEntryDecryptedResponse(
+                    id=item.id,
+                    application_id=item.application_id,
+                    username=codec.username(item.username, item.encrypted_username),
+                    environment=item.environment,
+                    created_at=item.created_at,
+                    decrypted_password=plaintext
+                ).model_dump_json() + "\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
 @app.delete("/passwords/{entry_id}")
 def delete_password(entry_id: UUID, req: schemas.DeleteRequest, db: Session = Depends(database.get_db)):
-    verify_mp(db, req.master_password)
+    authorize(db, req.master_password, req.session_token)
     item = db.query(models.PasswordEntry).filter(models.PasswordEntry.id == entry_id).first()
     if not item:
         raise HTTPException(status_code=404, detail="Entry not found")
     
     db.delete(item)
     db.commit()
+    search.purges.request(db.get_bind(), ["password"])
     return {"message": "Password deleted"}
 
 # --- SEED / INIT ---
 # Useful for dev
 @app.post("/dev/seed")
-def seed_data(master_password: str = Body(...), db: Session = Depends(database.get_db)):
+def seed_data(master_password: Optional[str] = Body(None), session_token: Optional[str] = Body(None), db: Session = Depends(database.get_db)):
     """Create basic structure if empty: Work/Personal Cats and some Apps."""
-    user = verify_mp(db, master_password)
+    authorize(db, master_password, session_token)
     
     if db.query(models.Category).first():
         return {"message": "Data already exists, skipping seed"}
@@ -253,6 +616,7 @@ def seed_data(master_password: str = Body(...), db: Session = Depends(database.g
     cat_pers = models.Category(name="Personal", description="Private stuff")
     db.add_all([cat_work, cat_pers])
     db.commit()
+    cache.listings.invalidate(db)
     db.refresh(cat_work)
     
     # Apps
@@ -260,140 +624,402 @@ def seed_data(master_password: str = Body(...), db: Session = Depends(database.g
     app2 = models.Application(name="Slack", category_id=cat_work.id)
     app3 = models.Application(name="Netflix", category_id=cat_pers.id)
 # --- IMPORT / EXPORT ---
+def hierarchy_select(*columns, include_empty_categories: bool = False, with_passwords: bool = False):
+    """
+    Builds one ordered SELECT over Category -> Application (-> PasswordEntry),
+    so exports walk the whole vault in a single query instead of lazy-loading per level.
+    """
+    stmt = select(*columns).select_from(models.Category).join(
+        models.Application, models.Application.category_id == models.Category.id, isouter=include_empty_categories
+    )
+    order = [models.Category.name, models.Application.name]
+    if with_passwords:
+        stmt = stmt.outerjoin(models.PasswordEntry, models.PasswordEntry.application_id == models.Application.id)
+        order.append(models.PasswordEntry.created_at)
+    return stmt.order_by(*order)
+
+# Rows fetched per round trip (and decrypted per crypto job) while streaming an export
+EXPORT_BATCH_SIZE = 1000
+
 @app.post("/export/csv")
-def export_csv(master_password: str = Body(...), db: Session = Depends(database.get_db)):
-    """Export all decrypted data to CSV."""
-    user = verify_mp(db, master_password)
-    
-    # Generate CSV in memory
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Header
-    writer.writerow(["Category", "Application", "App Description", "Username", "Environment", "Password", "Last Updated"])
-    
-    # Fetch all data
-    cats = db.query(models.Category).all()
-    
-    master_key = crypto.derive_key(master_password, user.master_key_salt)
-    
-    for c in cats:
-        for a in c.applications:
-            # If no passwords, write app info at least? 
-            # Design choice: Only write rows for passwords, effectively flattening the hierarchy
-            pws = db.query(models.PasswordEntry).filter(models.PasswordEntry.application_id == a.id).all()
-            if not pws:
-                 # Write a row with empty credentials just to list the app
-                 writer.writerow([c.name, a.name, a.description, "", "", "", ""])
-            else:
-                 for p in pws:
-                     # Decrypt
-                     try:
-                         plaintext = crypto.decrypt_password(p.encrypted_password, p.nonce, master_key)
-                     except:
-                         plaintext = "[DECRYPTION ERROR]"
-                     
-                     writer.writerow([
-                         c.name, 
-                         a.name, 
-                         a.description, 
-                         p.username, 
-                         p.environment, 
-                         plaintext,
-                         p.updated_at
-                     ])
-    
-    output.seek(0)
+def export_csv(master_password: Optional[str] = Body(None), session_token: Optional[str] = Body(None), db: Session = Depends(database.get_db)):
+    """Export all decrypted data to CSV, streamed in chunks of EXPORT_BATCH_SIZE rows."""
+    _, master_key = authorize(db, master_password, session_token, need_key=True)
+    cipher = keys.data_cipher(db, master_key)
+    codec = fields.FieldCodec(master_key, cipher)
+    # The request session is closed once the handler returns, so the stream gets its own
+    bind = db.get_bind()
+
+    def generate():
+        output = io.StringIO()
+        writer = csv.writer(output)
+
+        def flush():
+            data = output.getvalue()
+            output.seek(0)
+            output.truncate(0)
+            return data
+
+        # Header
+        writer.writerow(["Category", "Application", "App Description", "Username", "Environment", "Password", "Last Updated"])
+        yield flush()
+
+        with Session(bind=bind) as stream_db:
+            # One ordered pass over the hierarchy; apps without passwords still get a row
+            stmt = hierarchy_select(
+                models.Category.name.label("category"),
+                models.Application.name.label("application"),
+                models.Application.description,
+                models.Application.encrypted_description,
+                models.PasswordEntry.username,
+                models.PasswordEntry.encrypted_username,
+                models.PasswordEntry.environment,
+                models.PasswordEntry.encrypted_password,
+                models.PasswordEntry.nonce,
+                models.PasswordEntry.created_at,
+                with_passwords=True
+            ).execution_options(yield_per=EXPORT_BATCH_SIZE)
+            for batch in stream_db.execute(stmt).partitions():
+                encrypted = [(r.encrypted_password, r.nonce) for r in batch if r.encrypted_password is not None]
+                plaintexts = iter(workers.pool.submit(cipher.decrypt_many, encrypted, wait=True).result())
+                for r in batch:
+                    description = codec.description(r.description, r.encrypted_description)
+                    if r.encrypted_password is None:
+                        writer.writerow([r.category, r.application, description, "", "", "", ""])
+                        continue
+                    plaintext = next(plaintexts)
+                    writer.writerow([
+                        r.category,
+                        r.application,
+                        description,
+                        codec.username(r.username, r.encrypted_username),
+                        r.environment,
+                        plaintext if plaintext is not None else "[DECRYPTION ERROR]",
+                        r.created_at
+                    ])
+                yield flush()
+
     return StreamingResponse(
-        iter([output.getvalue()]), 
+        generate(), 
         media_type="text/csv", 
         headers={"Content-Disposition": "attachment; filename=vault_export.csv"}
     )
 
 @app.get("/export", response_model=dict)
-def export_data(master_password: str = Body(...), db: Session = Depends(database.get_db)):
+def export_data(master_password: Optional[str] = Body(None), session_token: Optional[str] = Body(None), db: Session = Depends(database.get_db)):
     """Export full hierarchy to JSON."""
-    verify_mp(db, master_password)
+    authorize(db, master_password, session_token)
     
-    cats = db.query(models.Category).all()
+    rows = db.execute(hierarchy_select(
+        models.Category.name.label("category"),
+        models.Category.description,
+        models.Application.name.label("application"),
+        include_empty_categories=True
+    ))
     result = {"categories": []}
     
-    for c in cats:
-        c_data = {
-            "name": c.name,
-            "description": c.description,
-            "apps": []
-        }
-        for a in c.applications:
-            c_data["apps"].append(a.name) # Simple export for now, or full obj? User asked for structure "to create password of applications", so names are enough to re-create structure.
-        result["categories"].append(c_data)
+    c_data = None
+    for r in rows:
+        if c_data is None or c_data["name"] != r.category:
+            c_data = {
+                "name": r.category,
+                "description": r.description,
+                "apps": []
+            }
+            result["categories"].append(c_data)
+        if r.application is not None:
+            c_data["apps"].append(r.application) # Names are enough to re-create the structure via /import
         
     return result
 
-from pydantic import BaseModel
-
-class ImportData(BaseModel):
-    master_password: str
+class ImportData(schemas.VaultAuth):
     categories: List[dict] # [{"name": "C1", "description": "D1", "apps": ["A1", "A2"]}]
 
 @app.post("/import")
 def import_data(data: ImportData, db: Session = Depends(database.get_db)):
     """Bulk create categories and apps from JSON (Structure only, legacy support)."""
-    verify_mp(db, data.master_password)
-    
-    created_cats = 0
-    created_apps = 0
-    
+    authorize(db, data.master_password, data.session_token)
+
+    # Collapse the payload into the wanted names first (duplicates and malformed entries are dropped)
+    wanted_cats = {}  # name -> description
+    wanted_apps = {}  # category name -> {app name: None} (ordered set)
     for c_in in data.categories:
-        # Find or Create Category
-        cat = db.query(models.Category).filter(models.Category.name == c_in["name"]).first()
-        if not cat:
-            cat = models.Category(
-                name=c_in["name"],
-                description=c_in.get("description", "")
-            )
-            db.add(cat)
-            db.commit()
-            db.refresh(cat)
-            created_cats += 1
-            
-        # Apps
-        if "apps" in c_in and isinstance(c_in["apps"], list):
-            for app_name in c_in["apps"]:
-                 # Check if app exists in this cat
-                 if not db.query(models.Application).filter(models.Application.category_id == cat.id, models.Application.name == app_name).first():
-                     new_app = models.Application(name=app_name, category_id=cat.id)
-                     db.add(new_app)
-                     created_apps += 1
-            db.commit() # Commit all apps for this cat
-            
-    return {"message": f"Imported {created_cats} categories and {created_apps} applications."}
+        name = c_in.get("name")
+        if not isinstance(name, str) or not name:
+            continue
+        wanted_cats.setdefault(name, c_in.get("description", ""))
+        apps = c_in.get("apps")
+        if isinstance(apps, list):
+            names = wanted_apps.setdefault(name, {})
+            for app_name in apps:
+                if isinstance(app_name, str) and app_name:
+                    names[app_name] = None
+
+    cat_ids, created_cats = bulk.ensure_categories(db, wanted_cats)
+    app_keys = {(cat_ids[cat_name], app_name): None for cat_name, names in wanted_apps.items() for app_name in names}
+    _, created_apps = bulk.ensure_applications(db, app_keys)
+    db.commit()
+    cache.listings.invalidate(db)
+
+    return {
+        "message": f"Imported {created_cats} categories and {created_apps} applications.",
+        "created_categories": created_cats,
+        "created_applications": created_apps,
+        "skipped_categories": len(wanted_cats) - created_cats,
+        "skipped_applications": len(app_keys) - created_apps
+    }
 
 # --- FILE IMPORT ---
 from fastapi import UploadFile, File, Form
 
+def check_duplicates_mode(duplicates: str):
+    if duplicates not in csv_utils.DUPLICATE_MODES:
+        raise HTTPException(status_code=400, detail=f"duplicates must be one of: {', '.join(csv_utils.DUPLICATE_MODES)}")
+
 @app.post("/import/file")
 def import_file(
     file: UploadFile = File(...), 
-    master_password: str = Form(...), 
+    master_password: Optional[str] = Form(None), 
+    session_token: Optional[str] = Form(None),
+    duplicates: str = Form(csv_utils.DUPLICATES_SKIP),
     db: Session = Depends(database.get_db)
 ):
-    """Import data from CSV (Chrome/Generic) file."""
+    """
+    Import data from CSV (Chrome/Generic) file, streamed from the upload in committed batches.
+    duplicates: skip (default), update or keep rows matching entries already in the vault.
+    """
+    check_duplicates_mode(duplicates)
+    _, master_key, key_version = authorize_key(db, master_password, session_token)
     try:
-        content = file.file.read()
-        
         # Determine handler based on extension or content-type
         filename = file.filename.lower()
         if filename.endswith(".csv"):
-             success, errors = csv_utils.process_csv_import(content, master_password, db)
-             return {"message": f"Import complete. Success: {success}, Errors: {errors}"}
+             stats = csv_utils.ImportStats()
+             success, errors = csv_utils.process_csv_import(
+                 file.file, master_key, db,
+                 # Each committed batch may have created categories/applications
+                 progress=lambda stats: cache.listings.invalidate(db),
+                 stats=stats,
+                 duplicates=duplicates,
+                 key_version=key_version
+             )
+             return {
+                 "message": f"Import complete. Success: {success}, Updated: {stats.updated}, Duplicates: {stats.duplicates}, Errors: {errors}",
+                 "success": success,
+                 "updated": stats.updated,
+                 "duplicates": stats.duplicates,
+                 "errors": errors
+             }
         
         # Future: JSON handler
         # if filename.endswith(".json"): ...
         
         raise HTTPException(status_code=400, detail="Unsupported file type. Please upload a .csv file.")
         
+    except (HTTPException, keys.KeyRotated, keys.RotationInProgress):
+        raise
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Import failed: {str(e)}")
+
+# --- IMPORT JOBS ---
+def import_job_response(job: jobs.Job) -> schemas.ImportJobResponse:
+    stats = job.progress
+    timestamp = lambda t: datetime.datetime.utcfromtimestamp(t) if t else None
+    return schemas.ImportJobResponse(
+        id=job.id,
+        state=job.state,
+        filename=job.description,
+        rows_processed=stats.rows,
+        success=stats.success,
+        updated=stats.updated,
+        duplicates=stats.duplicates,
+        errors=stats.errors,
+        batches=stats.batches,
+        rows_per_second=round(stats.rows / job.elapsed, 1) if job.elapsed else 0.0,
+        error_details=[schemas.ImportRowError(line=line, error=error) for line, error in stats.error_details],
+        error=job.error,
+        created_at=timestamp(job.created_at),
+        started_at=timestamp(job.started_at),
+        finished_at=timestamp(job.finished_at)
+    )
+
+@app.post("/import/jobs", response_model=schemas.ImportJobResponse, status_code=202)
+def submit_import_job(
+    file: UploadFile = File(...),
+    master_password: Optional[str] = Form(None),
+    session_token: Optional[str] = Form(None),
+    duplicates: str = Form(csv_utils.DUPLICATES_SKIP),
+    db: Session = Depends(database.get_db)
+):
+    """Queues a CSV import as a background job; poll GET /import/jobs/{id} for progress."""
+    check_duplicates_mode(duplicates)
+    _, master_key, key_version = authorize_key(db, master_password, session_token)
+    if not file.filename.lower().endswith(".csv"):
+        raise HTTPException(status_code=400, detail="Unsupported file type. Please upload a .csv file.")
+    if duplicates != csv_utils.DUPLICATES_KEEP:
+        # Checked again by the job; failing here spares the upload
+        keys.check_not_rotating(db)
+
+    # The upload is discarded when the request ends, so the job reads from its own copy
+    spool = tempfile.NamedTemporaryFile(prefix="vault-import-", suffix=".csv", delete=False)
+    with spool:
+        shutil.copyfileobj(file.file, spool)
+    # Private copy of the key: a session key is wiped if the vault is locked mid-import
+    job_key = bytearray(master_key)
+    bind = db.get_bind()
+
+    def run(job: jobs.Job):
+        try:
+            job.check_cancelled()
+            with open(spool.name, "rb") as source, Session(bind=bind) as job_db:
+                def batch_committed(stats: csv_utils.ImportStats):
+                    cache.listings.invalidate(job_db)
+                    job.check_cancelled()
+
+                csv_utils.process_csv_import(
+                    source, job_key, job_db,
+                    progress=batch_committed,
+                    stats=job.progress,
+                    duplicates=duplicates,
+                    key_version=key_version
+                )
+        finally:
+            job_key[:] = bytes(len(job_key))
+            os.remove(spool.name)
+
+    job = jobs.Job("csv_import", description=file.filename)
+    job.progress = csv_utils.ImportStats()
+    jobs.registry.submit(job, run)
+    return import_job_response(job)
+
+@app.get("/import/jobs/{job_id}", response_model=schemas.ImportJobResponse)
+def get_import_job(job_id: str):
+    job = jobs.registry.get(job_id)
+    if not job or job.kind != "csv_import":
+        raise HTTPException(status_code=404, detail="Job not found")
+    return import_job_response(job)
+
+@app.delete("/import/jobs/{job_id}", response_model=schemas.ImportJobResponse)
+def cancel_import_job(job_id: str, req: schemas.DeleteRequest, db: Session = Depends(database.get_db)):
+    """Cancels a job. Batches already committed are kept; the job stops before the next one."""
+    authorize(db, req.master_password, req.session_token)
+    job = jobs.registry.get(job_id)
+    if not job or job.kind != "csv_import":
+        raise HTTPException(status_code=404, detail="Job not found")
+    job.cancel()
+    return import_job_response(job)
+
+# --- KEY ROTATION ---
+@app.post("/rotate/master-password")
+def change_master_password(req: schemas.MasterPasswordChange, db: Session = Depends(database.get_db)):
+    """Changes the master password by re-wrapping the data key; no entry is re-encrypted. Locks every session."""
+    if not req.new_master_password:
+        raise HTTPException(status_code=400, detail="New master password must not be empty")
+    user = verify_mp(db, req.master_password)
+    keys.change_master_password(db, user, req.master_password, req.new_master_password)
+    sessions.store.close_all()
+    return {"message": "Master password changed"}
+
+def key_rotation_response(job: jobs.Job) -> schemas.KeyRotationJobResponse:
+    stats = job.progress
+    timestamp = lambda t: datetime.datetime.utcfromtimestamp(t) if t else None
+    return schemas.KeyRotationJobResponse(
+        id=job.id,
+        state=job.state,
+        version=stats.version,
+        entries=stats.entries,
+        failed=stats.failed,
+        batches=stats.batches,
+        error=job.error,
+        created_at=timestamp(job.created_at),
+        started_at=timestamp(job.started_at),
+        finished_at=timestamp(job.finished_at)
+    )
+
+@app.post("/rotate/data-key", response_model=schemas.KeyRotationJobResponse, status_code=202)
+def rotate_data_key(req: schemas.UnlockRequest, db: Session = Depends(database.get_db)):
+    """
+    Replaces the data-encryption key and re-encrypts every entry in a background job,
+    committed batch by batch; reads keep working throughout. If an earlier rotation did
+    not finish (cancelled, crashed, restarted), this resumes it instead of starting another.
+    """
+    user = verify_mp(db, req.master_password)
+    running = jobs.registry.active("key_rotation")
+    if running:
+        return key_rotation_response(running[0])
+    if jobs.registry.active("csv_import") or jobs.registry.active("metadata_rotation"):
+        # These jobs hold a copy of the current key and would keep writing with it
+        raise HTTPException(status_code=409, detail="Wait for running import and metadata jobs to finish before rotating the data key")
+    if not user.previous_wrapped_dek:
+        user = keys.rotate_data_key(db, user, req.master_password)
+        # Sessions hold the old key
+        sessions.store.close_all()
+
+    job_key = bytearray(keys.unlock(user, req.master_password))
+    bind = db.get_bind()
+
+    def run(job: jobs.Job):
+        try:
+            job.check_cancelled()
+            with Session(bind=bind) as job_db:
+                keys.reencrypt_entries(job_db, job_key, progress=lambda stats: job.check_cancelled(), stats=job.progress)
+        finally:
+            job_key[:] = bytes(len(job_key))
+
+    job = jobs.Job("key_rotation", description=f"data key v{user.dek_version}")
+    job.progress = keys.ReencryptStats()
+    job.progress.version = user.dek_version
+    jobs.registry.submit(job, run)
+    return key_rotation_response(job)
+
+@app.post("/rotate/metadata", response_model=schemas.KeyRotationJobResponse, status_code=202)
+def rotate_metadata(req: schemas.UnlockRequest, db: Session = Depends(database.get_db)):
+    """
+    Converts stored usernames and application descriptions to the configured mode
+    (VAULT_ENCRYPT_METADATA) and indexes usernames written before the blind index existed.
+    """
+    user = verify_mp(db, req.master_password)
+    running = jobs.registry.active("metadata_rotation") or jobs.registry.active("key_rotation")
+    if running:
+        return key_rotation_response(running[0])
+
+    job_key = bytearray(keys.unlock(user, req.master_password))
+    bind = db.get_bind()
+
+    def run(job: jobs.Job):
+        try:
+            job.check_cancelled()
+            with Session(bind=bind) as job_db:
+                keys.convert_metadata(job_db, job_key, progress=lambda stats: job.check_cancelled(), stats=job.progress)
+                cache.listings.invalidate(job_db)
+                # Plaintext replaced by sealed values must not linger in the search index
+                search.purge(job_db, rebuild=True)
+        finally:
+            job_key[:] = bytes(len(job_key))
+
+    job = jobs.Job("metadata_rotation", description="encrypted metadata" if fields.ENCRYPT_METADATA else "plaintext metadata")
+    job.progress = keys.ReencryptStats()
+    job.progress.version = user.dek_version
+    jobs.registry.submit(job, run)
+    return key_rotation_response(job)
+
+ROTATION_JOB_KINDS = ("key_rotation", "metadata_rotation")
+
+@app.get("/rotate/jobs/{job_id}", response_model=schemas.KeyRotationJobResponse)
+def get_key_rotation_job(job_id: str):
+    job = jobs.registry.get(job_id)
+    if not job or job.kind not in ROTATION_JOB_KINDS:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return key_rotation_response(job)
+
+@app.delete("/rotate/jobs/{job_id}", response_model=schemas.KeyRotationJobResponse)
+def cancel_key_rotation_job(job_id: str, req: schemas.DeleteRequest, db: Session = Depends(database.get_db)):
+    """Pauses a rotation after the current batch; POST /rotate/data-key resumes it."""
+    authorize(db, req.master_password, req.session_token)
+    job = jobs.registry.get(job_id)
+    if not job or job.kind not in ROTATION_JOB_KINDS:
+        raise HTTPException(status_code=404, detail="Job not found")
+    job.cancel()
+    return key_rotation_response(job)
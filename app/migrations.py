@@ -0,0 +1,91 @@
+"""
+In-place upgrades for databases created by older versions of the vault.
+Every step is idempotent, so upgrade() runs on each startup and can also be
+invoked manually:  python -m app.migrations
+"""
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from . import models, search
+
+
+def upgrade(engine: Engine):
+    if engine.dialect.name == "sqlite":
+        convert_sqlite_guids(engine)
+    add_missing_columns(engine)
+    create_missing_indexes(engine)
+    search.install(engine)
+
+
+def convert_sqlite_guids(engine: Engine):
+    """
+    Rewrites GUID columns stored in the other format (hex text <-> 16-byte blob)
+    to match models.GUID_STORAGE, one set-based UPDATE per column.
+    """
+    to_binary = models.GUID_STORAGE == "binary"
+    legacy_type = "text" if to_binary else "blob"
+
+    def convert(value):
+        if to_binary:
+            return bytes.fromhex(value) if isinstance(value, str) else value
+        return value.hex() if isinstance(value, bytes) else value
+
+    existing = set(inspect(engine).get_table_names())
+    with engine.begin() as conn:
+        conn.connection.driver_connection.create_function("vault_convert_guid", 1, convert, deterministic=True)
+        # Primary and foreign keys are rewritten column by column; only check FKs at commit
+        conn.execute(text("PRAGMA defer_foreign_keys = ON"))
+        for table in models.Base.metadata.sorted_tables:
+            if table.name not in existing:
+                continue
+            for column in table.columns:
+                if not isinstance(column.type, models.GUID):
+                    continue
+                result = conn.execute(text(
+                    f'UPDATE "{table.name}" SET "{column.name}" = vault_convert_guid("{column.name}") '
+                    f'WHERE typeof("{column.name}") = :legacy'
+                ), {"legacy": legacy_type})
+                if result.rowcount:
+                    print(f"Converted {result.rowcount} GUIDs in {table.name}.{column.name} to {models.GUID_STORAGE} storage.")
+
+
+def add_missing_columns(engine: Engine):
+    """create_all() never alters existing tables; add nullable columns declared since a table was created."""
+    inspector = inspect(engine)
+    existing = set(inspector.get_table_names())
+    with engine.begin() as conn:
+        for table in models.Base.metadata.sorted_tables:
+            if table.name not in existing:
+                continue
+            present = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in present:
+                    continue
+                if not column.nullable:
+                    print(f"Warning: cannot add non-nullable column {table.name}.{column.name} automatically")
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+                print(f"Added column {table.name}.{column.name}.")
+
+
+def create_missing_indexes(engine: Engine):
+    """create_all() only indexes new tables; add indexes declared since a table was created."""
+    existing = set(inspect(engine).get_table_names())
+    for table in models.Base.metadata.sorted_tables:
+        if table.name not in existing:
+            continue
+        for index in table.indexes:
+            try:
+                index.create(bind=engine, checkfirst=True)
+            except (IntegrityError, OperationalError) as e:
+                # e.g. duplicate (category_id, name) rows left by older versions
+                print(f"Warning: could not create index {index.name}: {e.orig}")
+
+
+if __name__ == "__main__":
+    from .database import engine
+    models.Base.metadata.create_all(bind=engine)
+    upgrade(engine)
+    print("Database schema is up to date.")
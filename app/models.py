@@ -1,16 +1,21 @@
-from sqlalchemy import Column, Integer, String, LargeBinary, DateTime, Text, ForeignKey
+from sqlalchemy import Column, Integer, String, LargeBinary, DateTime, Text, ForeignKey, Index, collate, event, text
 from sqlalchemy.orm import relationship
-from sqlalchemy.types import TypeDecorator, CHAR
+from sqlalchemy.types import TypeDecorator, BINARY, CHAR
 from sqlalchemy.dialects.postgresql import UUID
+import os
 import uuid
 import datetime
 from .database import Base
 
+# Storage for GUIDs on non-PostgreSQL databases: "binary" (16 raw bytes) or "hex" (legacy CHAR(32)).
+# Existing databases are converted by app.migrations when this changes.
+GUID_STORAGE = os.getenv("VAULT_GUID_STORAGE", "binary")
+
 # --- GUID Type for SQLite/Postgres Compatibility ---
 class GUID(TypeDecorator):
     """Platform-independent GUID type.
     Uses PostgreSQL's UUID type, otherwise uses
-    CHAR(32), storing as stringified hex values.
+    BINARY(16) (or CHAR(32) hex strings in "hex" storage mode).
     """
     impl = CHAR
     cache_ok = True
@@ -18,6 +23,8 @@ class GUID(TypeDecorator):
     def load_dialect_impl(self, dialect):
         if dialect.name == 'postgresql':
             return dialect.type_descriptor(UUID())
+        elif GUID_STORAGE == 'binary':
+            return dialect.type_descriptor(BINARY(16))
         else:
             return dialect.type_descriptor(CHAR(32))
 
@@ -28,18 +35,18 @@ class GUID(TypeDecorator):
             return str(value)
         else:
             if not isinstance(value, uuid.UUID):
-                return "%.32x" % uuid.UUID(value).int
-            else:
-                return "%.32x" % value.int
+                value = uuid.UUID(value)
+            if GUID_STORAGE == 'binary':
+                return value.bytes
+            return "%.32x" % value.int
 
     def process_result_value(self, value, dialect):
-        if value is None:
+        if value is None or isinstance(value, uuid.UUID):
             return value
+        elif isinstance(value, bytes):
+            return uuid.UUID(bytes=value)
         else:
-            if not isinstance(value, uuid.UUID):
-                return uuid.UUID(value)
-            else:
-                return value
+            return uuid.UUID(value)
 
 class User(Base):
     __tablename__ = "users"
@@ -49,6 +56,22 @@ class User(Base):
     password_hash = Column(String, nullable=False) 
     master_key_salt = Column(LargeBinary, nullable=False) 
 
+    # Data-encryption key (DEK), wrapped with the key derived from the master password.
+    # NULL for vaults created before key wrapping: their entries are sealed with the derived key itself.
+    wrapped_dek = Column(LargeBinary, nullable=True)
+    dek_version = Column(Integer, nullable=True)  # NULL = 1
+    # When dek_version was last bumped; the previous DEK is kept at least keys.KEY_ROTATION_GRACE past it
+    dek_rotated_at = Column(DateTime, nullable=True)
+    # Bumped by every master password change, so all workers drop sessions and cached hashes
+    credential_version = Column(Integer, nullable=True)  # NULL = 1
+    # Set while entries are being re-encrypted after a DEK rotation: the old DEK, wrapped with the new one
+    previous_wrapped_dek = Column(LargeBinary, nullable=True)
+
+    # Argon2id parameters the key-encryption key is derived with (NULL = crypto.LEGACY_KDF_PARAMS)
+    kdf_time_cost = Column(Integer, nullable=True)
+    kdf_memory_cost = Column(Integer, nullable=True)
+    kdf_parallelism = Column(Integer, nullable=True)
+
 class Category(Base):
     __tablename__ = "categories"
 
@@ -65,26 +88,67 @@ class Application(Base):
     id = Column(GUID(), primary_key=True, default=uuid.uuid4)
     name = Column(String, index=True, nullable=False)
     description = Column(String, nullable=True)
+    # With VAULT_ENCRYPT_METADATA the description is kept here instead (see fields.FieldCodec)
+    encrypted_description = Column(LargeBinary, nullable=True)
+    # Indexed through uq_applications_category_name (leading column)
     category_id = Column(GUID(), ForeignKey("categories.id"), nullable=False)
 
     # Relationships
     category = relationship("Category", back_populates="applications")
     passwords = relationship("PasswordEntry", back_populates="application", cascade="all, delete-orphan")
 
+# App names are unique within a category; the index also serves category_id lookups
+Index("uq_applications_category_name", Application.category_id, Application.name, unique=True)
+
+# --- Application name search indexes ---
+# PostgreSQL: trigram GIN index serves ILIKE prefix and substring searches.
+# SQLite: a NOCASE index lets the (case-insensitive) LIKE 'prefix%' use an index range scan.
+Index(
+    "ix_applications_name_trgm", Application.name,
+    postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}
+).ddl_if(dialect="postgresql")
+Index("ix_applications_name_nocase", collate(Application.name, "nocase")).ddl_if(dialect="sqlite")
+
+@event.listens_for(Base.metadata, "before_create")
+def enable_pg_trgm(target, connection, **kw):
+    if connection.dialect.name == "postgresql":
+        connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+
 class PasswordEntry(Base):
     __tablename__ = "passwords"
 
     id = Column(GUID(), primary_key=True, default=uuid.uuid4)
-    application_id = Column(GUID(), ForeignKey("applications.id"), nullable=False)
+    application_id = Column(GUID(), ForeignKey("applications.id"), nullable=False, index=True)
     
     username = Column(String, nullable=True)
     environment = Column(String, nullable=False, default="Production")
+    # With VAULT_ENCRYPT_METADATA the username is kept here instead (see fields.FieldCodec)
+    encrypted_username = Column(LargeBinary, nullable=True)
+    # Blind index (HMAC) of the username for exact-match lookups in either mode
+    username_index = Column(LargeBinary, nullable=True, index=True)
 
     # Encrypted fields
     encrypted_password = Column(LargeBinary, nullable=False)
     nonce = Column(LargeBinary, nullable=False) 
+
+    # Keyed HMAC of (application, username, password) for duplicate detection (see crypto.entry_fingerprint)
+    fingerprint = Column(LargeBinary, nullable=True, index=True)
+    # User.dek_version of the key that sealed this entry (NULL = 1)
+    key_version = Column(Integer, nullable=True)
+
+    # Password health (see audit.py); non-secret, kept current by every write
+    reuse_fingerprint = Column(LargeBinary, nullable=True, index=True)
+    strength = Column(Integer, nullable=True)
+    password_changed_at = Column(DateTime, nullable=True)
     
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
 
     # Relationship
     application = relationship("Application", back_populates="passwords")
+
+class CacheGeneration(Base):
+    """Generation counters for cache.ResponseCache's database backend."""
+    __tablename__ = "cache_generations"
+
+    name = Column(String, primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
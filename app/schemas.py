@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional
 from uuid import UUID
 from datetime import datetime
@@ -8,6 +8,27 @@ class UserCreate(BaseModel):
     username: str
     master_password: str
 
+# Credentials accepted by protected routes: either the master password itself
+# or a session token obtained from /unlock.
+class VaultAuth(BaseModel):
+    master_password: Optional[str] = None
+    session_token: Optional[str] = None
+
+class UnlockRequest(BaseModel):
+    master_password: str
+
+class MasterPasswordChange(BaseModel):
+    master_password: str
+    new_master_password: str
+
+class UnlockResponse(BaseModel):
+    session_token: str
+    expires_in: int
+    idle_timeout: int
+
+class LockRequest(BaseModel):
+    session_token: str
+
 class UserResponse(BaseModel):
     id: int
     username: str
@@ -19,11 +40,11 @@ class CategoryBase(BaseModel):
     name: str
     description: Optional[str] = None
 
-class CategoryCreate(CategoryBase):
-    master_password: str # Required for auth
+class CategoryCreate(CategoryBase, VaultAuth):
+    pass
 
-class CategoryUpdate(CategoryBase):
-    master_password: str
+class CategoryUpdate(CategoryBase, VaultAuth):
+    pass
 
 class CategoryResponse(CategoryBase):
     id: UUID
@@ -36,14 +57,14 @@ class ApplicationBase(BaseModel):
     description: Optional[str] = None
     category_id: UUID
 
-class ApplicationCreate(ApplicationBase):
-    master_password: str
+class ApplicationCreate(ApplicationBase, VaultAuth):
+    pass
 
-class ApplicationUpdate(ApplicationBase):
-    master_password: str
+class ApplicationUpdate(ApplicationBase, VaultAuth):
+    pass
 
-class DeleteRequest(BaseModel):
-    master_password: str
+class DeleteRequest(VaultAuth):
+    pass
 
 class ApplicationResponse(ApplicationBase):
     id: UUID
@@ -51,12 +72,11 @@ class ApplicationResponse(ApplicationBase):
         from_attributes = True
 
 # --- Passwords ---
-class PasswordEntryCreate(BaseModel):
+class PasswordEntryCreate(VaultAuth):
     application_id: UUID
     username: Optional[str] = None
     environment: str = "Production"
     plaintext_password: str
-    master_password: str 
 
 class PasswordEntryResponse(BaseModel):
     id: UUID
@@ -70,6 +90,17 @@ class PasswordEntryResponse(BaseModel):
 class PasswordEntryDecryptedResponse(PasswordEntryResponse):
     decrypted_password: str
 
+MAX_BATCH_DECRYPT = 1000
+
+class UsernameLookup(VaultAuth):
+    username: str
+    application_id: Optional[UUID] = None
+
+class PasswordBatchDecryptRequest(VaultAuth):
+    # Exactly one of entry_ids / application_id
+    entry_ids: Optional[List[UUID]] = Field(None, max_length=MAX_BATCH_DECRYPT)
+    application_id: Optional[UUID] = None
+
 # --- Hierarchy View ---
 # Used to fetch full tree: Category -> Apps -> Passwords (metadata)
 class ApplicationWithCount(ApplicationResponse):
@@ -77,3 +108,77 @@ class ApplicationWithCount(ApplicationResponse):
 
 class CategoryWithApps(CategoryResponse):
     applications: List[ApplicationWithCount] = []
+
+# --- Search ---
+class SearchHit(BaseModel):
+    kind: str  # "category", "application" or "password"
+    id: UUID
+    title: Optional[str]  # name, or username for passwords
+    detail: Optional[str]  # description, or environment for passwords
+    category_id: Optional[UUID]
+    application_id: Optional[UUID]
+    score: float
+
+# --- Audit ---
+class AuditRequest(VaultAuth):
+    # Entries (or reuse groups) listed per section; the counts cover the whole vault
+    limit: int = Field(100, ge=1, le=1000)
+
+class AuditEntry(BaseModel):
+    id: UUID
+    application_id: UUID
+    application: str
+    username: Optional[str]
+    environment: str
+    strength: int  # 0 (trivial) to 4 (strong)
+    password_changed_at: Optional[datetime]
+
+class ReuseGroup(BaseModel):
+    count: int
+    entries: List[AuditEntry]
+
+class AuditReport(BaseModel):
+    entries: int
+    audited: int  # the rest could not be decrypted
+    weak_count: int
+    reused_count: int
+    reuse_groups: int
+    stale_count: int
+    weak: List[AuditEntry]
+    reused: List[ReuseGroup]
+    stale: List[AuditEntry]
+
+# --- Import Jobs ---
+class ImportRowError(BaseModel):
+    line: int
+    error: str
+
+class ImportJobResponse(BaseModel):
+    id: str
+    state: str
+    filename: str
+    rows_processed: int = 0
+    success: int = 0
+    updated: int = 0
+    duplicates: int = 0
+    errors: int = 0
+    batches: int = 0
+    rows_per_second: float = 0.0
+    error_details: List[ImportRowError] = []
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+# --- Key Rotation ---
+class KeyRotationJobResponse(BaseModel):
+    id: str
+    state: str
+    version: int = 0
+    entries: int = 0
+    failed: int = 0
+    batches: int = 0
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
@@ -0,0 +1,281 @@
+"""
+Full-text search over vault metadata: category and application names and descriptions
+(which hold the URLs of imported entries), entry usernames and environments. Passwords
+are never indexed, nor are fields stored encrypted (see fields.ENCRYPT_METADATA).
+
+SQLite keeps one external-content FTS5 table per source table, maintained by triggers
+and joined back through the source rowid. VACUUM may renumber those rowids, so run
+python -m app.search afterwards to rebuild the index. FTS5 only tombstones removed
+rows, so their tokens stay in the index's shadow tables until purge() merges them out;
+deletes schedule that through purges, at most once per SEARCH_PURGE_INTERVAL.
+PostgreSQL uses GIN expression indexes over to_tsvector(). Other databases fall back
+to an unindexed LIKE scan.
+"""
+import os
+import re
+import threading
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy import bindparam, column, func, literal, literal_column, null, or_, select, table, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from . import models
+
+# Terms beyond this are ignored, so a pasted paragraph cannot produce a huge query
+MAX_TERMS = 8
+# Seconds between a delete and the background purge of its text from the SQLite index;
+# deletes in the meantime share that purge (each one rewrites the whole index)
+SEARCH_PURGE_INTERVAL = float(os.getenv("VAULT_SEARCH_PURGE_INTERVAL", "30"))
+
+
+class Source(NamedTuple):
+    kind: str
+    model: type
+    columns: Tuple[str, str]  # (title, detail)
+
+    @property
+    def table_name(self) -> str:
+        return self.model.__tablename__
+
+    @property
+    def index_name(self) -> str:
+        return f"search_{self.table_name}"
+
+
+SOURCES = [
+    Source("category", models.Category, ("name", "description")),
+    Source("application", models.Application, ("name", "description")),
+    Source("password", models.PasswordEntry, ("username", "environment")),
+]
+
+
+class SearchHit(NamedTuple):
+    kind: str
+    id: object
+    title: Optional[str]
+    detail: Optional[str]
+    category_id: object
+    application_id: object
+    score: float
+
+
+def terms(q: str) -> List[str]:
+    return re.findall(r"\w+", q)[:MAX_TERMS]
+
+
+# --- INDEX MAINTENANCE ---
+def install(engine: Engine):
+    """Creates the search index for the engine's database. Idempotent."""
+    if engine.dialect.name == "sqlite":
+        install_sqlite(engine)
+    elif engine.dialect.name == "postgresql":
+        install_postgresql(engine)
+
+def install_sqlite(engine: Engine):
+    with engine.begin() as conn:
+        for source in SOURCES:
+            name, title, detail = source.index_name, *source.columns
+            exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = :name"), {"name": name}).first()
+            if not exists:
+                try:
+                    conn.execute(text(
+                        f"CREATE VIRTUAL TABLE {name} USING fts5({title}, {detail}, "
+                        f"content='{source.table_name}', prefix='2 3', tokenize='unicode61 remove_diacritics 2')"
+                    ))
+                except OperationalError as e:
+                    # SQLite built without FTS5: searches use the LIKE fallback
+                    print(f"Warning: full-text search unavailable: {e.orig}")
+                    return
+            delete = f"INSERT INTO {name}({name}, rowid, {title}, {detail}) VALUES ('delete', old.rowid, old.{title}, old.{detail});"
+            insert = f"INSERT INTO {name}(rowid, {title}, {detail}) VALUES (new.rowid, new.{title}, new.{detail});"
+            conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS {name}_ai AFTER INSERT ON {source.table_name} BEGIN {insert} END"))
+            conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS {name}_ad AFTER DELETE ON {source.table_name} BEGIN {delete} END"))
+            # Bulk rewrites (e.g. key rotation) leave the indexed columns unchanged and skip the index
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS {name}_au AFTER UPDATE OF {title}, {detail} ON {source.table_name} "
+                f"WHEN old.{title} IS NOT new.{title} OR old.{detail} IS NOT new.{detail} BEGIN {delete} {insert} END"
+            ))
+            if not exists:
+                conn.execute(text(f"INSERT INTO {name}({name}) VALUES ('rebuild')"))
+                print(f"Built search index {name}.")
+
+def rebuild(engine: Engine):
+    """Re-reads every source row into the SQLite index (e.g. after VACUUM)."""
+    with engine.begin() as conn:
+        for source in SOURCES:
+            conn.execute(text(f"INSERT INTO {source.index_name}({source.index_name}) VALUES ('rebuild')"))
+
+def purge(db: Session, sources: List[Source] = SOURCES, rebuild: bool = False):
+    """
+    Drops deleted and replaced rows from the SQLite indexes of sources, e.g. after a delete
+    or after fields were converted to encrypted storage: 'optimize' merges every segment
+    into one without them, and secure_delete zeroes the pages freed. rebuild re-reads the
+    source table first. Rewrites each index, so it costs time proportional to its size.
+    """
+    if db.get_bind().dialect.name != "sqlite":
+        return
+    names = db.execute(
+        text("SELECT name FROM sqlite_master WHERE name IN :names").bindparams(bindparam("names", expanding=True)),
+        {"names": [source.index_name for source in sources]}
+    ).scalars().all()
+    secure_delete = db.execute(text("PRAGMA secure_delete")).scalar()
+    db.execute(text("PRAGMA secure_delete = 1"))
+    try:
+        for name in names:
+            if rebuild:
+                db.execute(text(f"INSERT INTO {name}({name}) VALUES ('rebuild')"))
+            db.execute(text(f"INSERT INTO {name}({name}) VALUES ('optimize')"))
+        db.commit()
+    finally:
+        db.execute(text(f"PRAGMA secure_delete = {int(secure_delete)}"))
+
+class PurgeScheduler:
+    """Batches purge() requests per database and runs them on a timer thread, off the request."""
+
+    def __init__(self, interval: float = SEARCH_PURGE_INTERVAL):
+        self.interval = interval
+        self._pending: Dict[Engine, Set[str]] = {}
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+
+    def request(self, bind: Engine, kinds: List[str]):
+        """Purges the indexes of the given source kinds within interval seconds."""
+        if bind.dialect.name != "sqlite":
+            return
+        with self._lock:
+            self._pending.setdefault(bind, set()).update(kinds)
+            if self._timer is None:
+                self._timer = threading.Timer(self.interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Runs the pending purges now (also called on shutdown)."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        for bind, kinds in pending.items():
+            try:
+                with Session(bind=bind) as db:
+                    purge(db, [s for s in SOURCES if s.kind in kinds])
+            except OperationalError as e:
+                print(f"Warning: search index purge failed: {e.orig}")
+
+
+purges = PurgeScheduler()
+
+def tsvector_sql(source: Source, prefix: str = "") -> str:
+    # Queries must repeat the indexed expression exactly for the planner to use the index
+    title, detail = (f"{prefix}{c}" for c in source.columns)
+    return f"to_tsvector('simple'::regconfig, coalesce({title}, '') || ' ' || coalesce({detail}, ''))"
+
+def install_postgresql(engine: Engine):
+    with engine.begin() as conn:
+        for source in SOURCES:
+            conn.execute(text(
+                f"CREATE INDEX IF NOT EXISTS ix_{source.index_name} ON {source.table_name} USING GIN ({tsvector_sql(source)})"
+            ))
+
+
+# --- QUERIES ---
+def hit_columns(source: Source):
+    """(id, title, detail, category_id, application_id) for a source."""
+    model = source.model
+    title, detail = (getattr(model, c) for c in source.columns)
+    if source.kind == "category":
+        return model.id, title, detail, null(), null()
+    if source.kind == "application":
+        return model.id, title, detail, model.category_id, null()
+    return model.id, title, detail, models.Application.category_id, model.application_id
+
+def base_select(source: Source, score):
+    stmt = select(literal(source.kind), *hit_columns(source), score)
+    if source.kind == "password":
+        stmt = stmt.join(models.Application, models.Application.id == models.PasswordEntry.application_id)
+    return stmt
+
+def sqlite_select(source: Source, words: List[str], limit: int):
+    index = table(source.index_name, column("rowid"), column("rank"))
+    # Every term must match, as a prefix; quoting keeps FTS5 operators out of user input
+    match = " ".join(f'"{word}"*' for word in words)
+    # Rank and cut inside the index first, so only the returned rows are joined
+    top = (
+        select(index.c.rowid, index.c.rank)
+        .where(text(f"{source.index_name} MATCH :match").bindparams(match=match))
+        .order_by(index.c.rank)
+        .limit(limit)
+        .subquery()
+    )
+    stmt = (
+        select(literal(source.kind), *hit_columns(source), (-top.c.rank).label("score"))
+        .select_from(top)
+        .join(source.model, literal_column(f"{source.table_name}.rowid") == top.c.rowid)
+    )
+    if source.kind == "password":
+        stmt = stmt.join(models.Application, models.Application.id == models.PasswordEntry.application_id)
+    return stmt.order_by(top.c.rank)
+
+def postgresql_select(source: Source, words: List[str], limit: int):
+    vector = literal_column(tsvector_sql(source, prefix=f"{source.table_name}."))
+    query = func.to_tsquery(literal_column("'simple'::regconfig"), " & ".join(f"{word}:*" for word in words))
+    score = func.ts_rank(vector, query)
+    return base_select(source, score.label("score")).where(vector.op("@@")(query)).order_by(score.desc()).limit(limit)
+
+def like_select(source: Source, words: List[str], limit: int):
+    model = source.model
+    columns = [getattr(model, c) for c in source.columns]
+    stmt = base_select(source, literal(0.0).label("score"))
+    for word in words:
+        stmt = stmt.where(or_(*(c.ilike(f"%{word}%") for c in columns)))
+    return stmt.order_by(columns[0]).limit(limit)
+
+# Databases known to have the FTS5 tables (only successes are remembered, so a later install is picked up)
+_fts_ready: Dict[str, bool] = {}
+
+async def has_fts(db: AsyncSession) -> bool:
+    database = db.bind.url.database
+    if database not in _fts_ready:
+        found = (await db.execute(text(
+            "SELECT count(*) FROM sqlite_master WHERE name IN ('search_categories', 'search_applications', 'search_passwords')"
+        ))).scalar()
+        if found < len(SOURCES):
+            return False
+        _fts_ready[database] = True
+    return True
+
+async def search(db: AsyncSession, q: str, limit: int, offset: int = 0) -> Tuple[List[SearchHit], bool]:
+    """
+    Ranked hits across all sources, best first. Each source returns at most offset + limit + 1
+    rows from its own index, which are merged by score. Returns (hits, more pages exist).
+    """
+    words = terms(q)
+    if not words:
+        return [], False
+    dialect = db.bind.dialect.name
+    if dialect == "sqlite" and await has_fts(db):
+        build = sqlite_select
+    elif dialect == "postgresql":
+        build = postgresql_select
+    else:
+        build = like_select
+
+    wanted = offset + limit + 1
+    hits = []
+    for source in SOURCES:
+        result = await db.execute(build(source, words, wanted))
+        hits.extend(SearchHit(*row) for row in result)
+    hits.sort(key=lambda hit: hit.score, reverse=True)
+    return hits[offset:offset + limit], len(hits) > offset + limit
+
+
+if __name__ == "__main__":
+    from .database import engine
+    install(engine)
+    if engine.dialect.name == "sqlite":
+        rebuild(engine)
+    print("Search index is up to date.")
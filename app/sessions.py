@@ -0,0 +1,104 @@
+import os
+import secrets
+import threading
+import time
+from typing import Dict, Optional
+
+# Configuration
+# A session lives at most SESSION_TTL seconds, and is locked earlier if it has not
+# been used for SESSION_IDLE_TIMEOUT seconds.
+SESSION_TTL = int(os.getenv("VAULT_SESSION_TTL", "900"))
+SESSION_IDLE_TIMEOUT = int(os.getenv("VAULT_SESSION_IDLE_TIMEOUT", "300"))
+MAX_SESSIONS = int(os.getenv("VAULT_MAX_SESSIONS", "64"))
+
+
+class VaultSession:
+    """An unlocked vault: the derived master key kept in memory behind a random token."""
+
+    def __init__(self, token: str, user_id: int, master_key: bytes, now: float, key_version: int = 1, credential_version: int = 1):
+        self.token = token
+        self.user_id = user_id
+        # User.dek_version the key belongs to; sessions opened before a key rotation are refused
+        self.key_version = key_version
+        # User.credential_version at unlock; sessions opened before a password change are refused
+        self.credential_version = credential_version
+        # bytearray so the key can be overwritten when the session ends
+        self.master_key = bytearray(master_key)
+        self.created_at = now
+        self.last_used = now
+
+    def expires_at(self, ttl: int, idle_timeout: int) -> float:
+        return min(self.created_at + ttl, self.last_used + idle_timeout)
+
+    def wipe(self):
+        """Overwrites the key material in place."""
+        self.master_key[:] = bytes(len(self.master_key))
+
+
+class SessionStore:
+    """
+    In-memory registry of unlocked sessions.
+    Tokens are never persisted: restarting the server locks every session.
+    """
+
+    def __init__(self, ttl: int = SESSION_TTL, idle_timeout: int = SESSION_IDLE_TIMEOUT, max_sessions: int = MAX_SESSIONS):
+        self.ttl = ttl
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self._sessions: Dict[str, VaultSession] = {}
+        self._lock = threading.Lock()
+
+    def open(self, user_id: int, master_key: bytes, key_version: int = 1, credential_version: int = 1) -> VaultSession:
+        """Creates a new session holding a copy of master_key."""
+        now = time.monotonic()
+        session = VaultSession(secrets.token_urlsafe(32), user_id, master_key, now, key_version, credential_version)
+        with self._lock:
+            self._purge(now)
+            if len(self._sessions) >= self.max_sessions:
+                # Drop the least recently used session to stay within the bound
+                oldest = min(self._sessions.values(), key=lambda s: s.last_used)
+                self._discard(oldest.token)
+            self._sessions[session.token] = session
+        return session
+
+    def get(self, token: str) -> Optional[VaultSession]:
+        """Returns the live session for token (refreshing its idle timer) or None."""
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(token)
+            if session is None:
+                return None
+            if now >= session.expires_at(self.ttl, self.idle_timeout):
+                self._discard(token)
+                return None
+            session.last_used = now
+            return session
+
+    def close(self, token: str) -> bool:
+        """Locks a single session. Returns False if it was unknown or already expired."""
+        with self._lock:
+            return self._discard(token)
+
+    def close_all(self):
+        """Locks this worker's sessions; other workers refuse theirs through the version checks."""
+        with self._lock:
+            for token in list(self._sessions):
+                self._discard(token)
+
+    def expires_in(self, session: VaultSession) -> int:
+        return max(0, int(session.expires_at(self.ttl, self.idle_timeout) - time.monotonic()))
+
+    def _purge(self, now: float):
+        expired = [t for t, s in self._sessions.items() if now >= s.expires_at(self.ttl, self.idle_timeout)]
+        for token in expired:
+            self._discard(token)
+
+    def _discard(self, token: str) -> bool:
+        session = self._sessions.pop(token, None)
+        if session is None:
+            return False
+        session.wipe()
+        return True
+
+
+store = SessionStore()
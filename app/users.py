@@ -0,0 +1,115 @@
+import datetime
+import os
+import threading
+import time
+from typing import NamedTuple, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from . import cache, crypto, models
+
+# Configuration
+# The vault has a single user whose hash and salt only change at setup or rotation.
+# Each worker caches the row and re-reads it at most every USER_CACHE_TTL seconds,
+# so changes made through another worker process are picked up within that window.
+# USER_CACHE_CHECK = "generation" makes credential checks (current()) also compare the
+# shared "users" row of cache_generations, bumped by every key change, so password
+# changes and rotations apply in every worker at once, for one primary-key read per request.
+USER_CACHE_TTL = float(os.getenv("VAULT_USER_CACHE_TTL", "60"))
+USER_CACHE_CHECK = os.getenv("VAULT_USER_CACHE_CHECK", "ttl")  # "ttl" or "generation"
+
+# Bumped in the transaction of every change to the user's keys
+generation = cache.DatabaseGeneration("users")
+
+
+class UserRecord(NamedTuple):
+    id: int
+    username: str
+    password_hash: str
+    master_key_salt: bytes
+    wrapped_dek: Optional[bytes] = None
+    dek_version: int = 1
+    previous_wrapped_dek: Optional[bytes] = None
+    kdf_params: crypto.KdfParams = crypto.LEGACY_KDF_PARAMS
+    dek_rotated_at: Optional[datetime.datetime] = None
+    credential_version: int = 1
+
+    @classmethod
+    def from_model(cls, user: Optional[models.User]) -> Optional["UserRecord"]:
+        if user is None:
+            return None
+        return cls(
+            user.id, user.username, user.password_hash, bytes(user.master_key_salt),
+            user.wrapped_dek, user.dek_version or 1, user.previous_wrapped_dek,
+            kdf_params(user), user.dek_rotated_at, user.credential_version or 1
+        )
+
+
+def kdf_params(user: models.User) -> crypto.KdfParams:
+    if user.kdf_time_cost is None:
+        return crypto.LEGACY_KDF_PARAMS
+    return crypto.KdfParams(user.kdf_time_cost, user.kdf_memory_cost, user.kdf_parallelism)
+
+
+class UserCache:
+    """Process-local copy of the User row (or of its absence, before setup)."""
+
+    def __init__(self, ttl: float = USER_CACHE_TTL):
+        self.ttl = ttl
+        self._record: Optional[UserRecord] = None
+        self._loaded_at: Optional[float] = None
+        # users generation the record was read at (USER_CACHE_CHECK = "generation" only)
+        self._generation: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _fresh(self) -> bool:
+        # An uninitialized vault is re-checked every time: setup may happen in another worker
+        return self._record is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    def get(self, db: Session) -> Optional[UserRecord]:
+        with self._lock:
+            if self._fresh():
+                return self._record
+        return self.load(db)
+
+    def current(self, db: Session) -> Optional[UserRecord]:
+        """get() for verifying credentials, which also honours USER_CACHE_CHECK."""
+        if USER_CACHE_CHECK != "generation":
+            return self.get(db)
+        value = generation.read(db)
+        with self._lock:
+            if self._fresh() and self._generation == value:
+                return self._record
+        return self.load(db)
+
+    async def get_async(self, db: AsyncSession) -> Optional[UserRecord]:
+        with self._lock:
+            if self._fresh():
+                return self._record
+        user = (await db.execute(select(models.User).limit(1))).scalar()
+        return self.set(UserRecord.from_model(user))
+
+    def load(self, db: Session) -> Optional[UserRecord]:
+        """Reads the row from the database, bypassing the cache."""
+        # Read first: a change committed in between only costs another reload
+        value = generation.read(db) if USER_CACHE_CHECK == "generation" else None
+        user = db.execute(select(models.User).limit(1)).scalar()
+        return self.set(UserRecord.from_model(user), value)
+
+    def set(self, record: Optional[UserRecord], generation: Optional[int] = None) -> Optional[UserRecord]:
+        with self._lock:
+            self._record = record
+            self._loaded_at = time.monotonic()
+            self._generation = generation
+        return record
+
+    def invalidate(self):
+        """Forces the next get() to hit the database (call after setup or key rotation)."""
+        with self._lock:
+            self._record = None
+            self._loaded_at = None
+
+
+cache = UserCache()
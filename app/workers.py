@@ -0,0 +1,94 @@
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Iterable, List
+
+from . import crypto
+
+# Configuration
+# Argon2 and AES-GCM run on a dedicated pool instead of Starlette's request threadpool.
+# At most CRYPTO_MAX_PENDING jobs may be queued or running at once; further requests are
+# rejected with 503 so memory stays bounded (each in-flight Argon2 call holds ~64 MiB)
+# and the remaining request threads stay available for cheap metadata reads.
+CRYPTO_EXECUTOR = os.getenv("VAULT_CRYPTO_EXECUTOR", "thread")  # "thread" or "process"
+CRYPTO_WORKERS = int(os.getenv("VAULT_CRYPTO_WORKERS", str(min(4, os.cpu_count() or 1))))
+CRYPTO_MAX_PENDING = int(os.getenv("VAULT_CRYPTO_MAX_PENDING", str(CRYPTO_WORKERS * 2)))
+RETRY_AFTER = int(os.getenv("VAULT_CRYPTO_RETRY_AFTER", "1"))
+
+
+class PoolSaturated(Exception):
+    """Raised when the crypto pool already has max_pending jobs in flight."""
+
+
+class CryptoPool:
+    """Size-limited executor for KDF and AEAD work with admission control."""
+
+    def __init__(self, workers: int = CRYPTO_WORKERS, max_pending: int = CRYPTO_MAX_PENDING, kind: str = CRYPTO_EXECUTOR):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown executor kind: {kind}")
+        self.workers = workers
+        self.max_pending = max_pending
+        self.kind = kind
+        self._slots = threading.BoundedSemaphore(max_pending) if max_pending > 0 else None
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        # Created lazily so importing the app does not fork worker processes
+        with self._lock:
+            if self._executor is None:
+                if self.kind == "process":
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                else:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="vault-crypto")
+            return self._executor
+
+    def submit(self, fn: Callable, *args, wait: bool = False) -> Future:
+        """
+        Schedules fn(*args). Raises PoolSaturated when the pool is full,
+        unless wait is set, in which case the caller blocks until a slot frees up.
+        """
+        if self._slots is None or not self._slots.acquire(blocking=wait):
+            raise PoolSaturated()
+        try:
+            future = self.executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def run(self, fn: Callable, *args) -> Any:
+        """Runs fn(*args) on the pool and waits for the result."""
+        return self.submit(fn, *args).result()
+
+    def map(self, fn: Callable, items: Iterable) -> List[Any]:
+        """Applies fn to every item on the pool, waiting for free slots instead of failing."""
+        futures = [self.submit(fn, item, wait=True) for item in items]
+        return [f.result() for f in futures]
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+
+pool = CryptoPool()
+
+# --- Pool-backed crypto helpers ---
+def derive_key(master_password: str, salt: bytes, params: crypto.KdfParams = crypto.KDF_PARAMS) -> bytes:
+    """Same as crypto.derive_key, but cache misses are computed on the pool."""
+    fingerprint = crypto.key_cache.fingerprint(master_password, salt, params)
+    key = crypto.key_cache.get(fingerprint)
+    if key is None:
+        key = pool.run(crypto.derive_key_uncached, master_password, salt, params)
+        crypto.key_cache.put(fingerprint, key)
+    return key
+
+def hash_master_password(password: str) -> str:
+    return pool.run(crypto.hash_master_password, password)
+
+def verify_master_password(password: str, hash_str: str) -> bool:
+    return pool.run(crypto.verify_master_password, password, hash_str)
@@ -0,0 +1,101 @@
+"""
+Benchmark for concurrent reads against SQLite, with and without the tuned engine profile
+(database.make_engine: WAL, synchronous=NORMAL, mmap, cache, busy timeout, sized pool).
+A writer thread commits small transactions throughout, as imports and edits would.
+Run: python -m tests.bench_db [readers] [seconds]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from app import database, models
+
+
+def populate(engine, categories: int = 20, apps_per_category: int = 50):
+    models.Base.metadata.create_all(bind=engine)
+    with sessionmaker(bind=engine)() as db:
+        for c in range(categories):
+            cat = models.Category(name=f"Category{c}")
+            for a in range(apps_per_category):
+                app = models.Application(name=f"App{c}-{a}", category=cat)
+                app.passwords = [models.PasswordEntry(username=f"user{i}", encrypted_password=b"x" * 32, nonce=b"n" * 12) for i in range(3)]
+            db.add(cat)
+        db.commit()
+
+
+def run_load(engine, readers: int, seconds: float) -> dict:
+    Session = sessionmaker(bind=engine)
+    stop = threading.Event()
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    lock = threading.Lock()
+
+    def reader():
+        query = select(models.Application.id, models.Application.name).order_by(models.Application.name).limit(100)
+        done = errors = 0
+        while not stop.is_set():
+            try:
+                with Session() as db:
+                    db.execute(query).all()
+                    db.execute(select(models.PasswordEntry.id).limit(200)).all()
+                done += 1
+            except OperationalError:
+                errors += 1
+        with lock:
+            counts["reads"] += done
+            counts["errors"] += errors
+
+    def writer():
+        with Session() as db:
+            app_id = db.execute(select(models.Application.id).limit(1)).scalar()
+        done = errors = 0
+        while not stop.is_set():
+            try:
+                with Session() as db:
+                    db.add(models.PasswordEntry(application_id=app_id, username="w", encrypted_password=b"x" * 32, nonce=b"n" * 12))
+                    db.commit()
+                done += 1
+            except OperationalError:
+                errors += 1
+        with lock:
+            counts["writes"] += done
+            counts["errors"] += errors
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)] + [threading.Thread(target=writer)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    return {k: v / seconds if k != "errors" else v for k, v in counts.items()}
+
+
+def run_benchmark(readers: int = 8, seconds: float = 5.0):
+    profiles = {
+        "default": lambda url: create_engine(url, connect_args={"check_same_thread": False}),
+        "tuned": database.make_engine,
+    }
+    results = {}
+    for name, factory in profiles.items():
+        with tempfile.TemporaryDirectory() as tmp:
+            url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+            engine = factory(url)
+            populate(engine)
+            results[name] = run_load(engine, readers, seconds)
+            engine.dispose()
+        r = results[name]
+        print(f"{name:>8}: {r['reads']:,.0f} reads/s, {r['writes']:,.0f} writes/s, {r['errors']} lock errors ({readers} readers + 1 writer)")
+    return results
+
+
+if __name__ == "__main__":
+    run_benchmark(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 8,
+        float(sys.argv[2]) if len(sys.argv) > 2 else 5.0
+    )
@@ -0,0 +1,57 @@
+"""
+Benchmark for the CSV import pipeline, with the thread and the process crypto executor.
+Fails if either imports fewer than FLOOR rows/s. Hashing, scoring and encryption spread
+over the crypto pool, but the SQLite writes stay on one core, so extra cores raise the
+rate well below linearly.
+Run: python -m tests.bench_import [rows] [floor]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import models, csv_utils, crypto, workers
+
+# Measured on a single core: ~10k rows/s with either executor
+FLOOR = 8000
+
+
+def make_csv(rows: int) -> bytes:
+    lines = ["name,url,username,password"]
+    # ~1 app per 5 rows, like a typical browser export
+    lines += [f"Site{i // 5},https://site{i // 5}.example.com,user{i}@example.com,P@ssw0rd-{i:08d}" for i in range(rows)]
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def run_benchmark(rows: int = 50000, executor: str = "thread"):
+    content = make_csv(rows)
+    master_key = crypto.generate_salt() * 2  # any 32 bytes
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        models.Base.metadata.create_all(bind=engine)
+        db = sessionmaker(bind=engine)()
+        saved, workers.pool = workers.pool, workers.CryptoPool(kind=executor)
+        try:
+            start = time.perf_counter()
+            success, errors = csv_utils.process_csv_import(content, master_key, db)
+            elapsed = time.perf_counter() - start
+        finally:
+            workers.pool.shutdown()
+            workers.pool = saved
+            db.close()
+            engine.dispose()
+
+    print(f"{executor:>7}: imported {success} rows ({errors} errors) in {elapsed:.2f}s: {success / elapsed:,.0f} rows/s")
+    return success / elapsed
+
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    floor = float(sys.argv[2]) if len(sys.argv) > 2 else FLOOR
+    for executor in ("thread", "process"):
+        rate = run_benchmark(rows, executor)
+        assert rate >= floor, f"{executor} executor: {rate:,.0f} rows/s is below the floor of {floor:,.0f} rows/s"
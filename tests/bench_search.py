@@ -0,0 +1,78 @@
+"""
+Benchmark for GET /search: FTS5 index versus the unindexed LIKE fallback on SQLite.
+Run: python -m tests.bench_search [entries]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from app import models, search
+
+QUERIES = ["app12", "user4567", "staging", "example com", "nomatch"]
+
+
+def populate(engine, entries: int):
+    models.Base.metadata.create_all(bind=engine)
+    cats = [{"id": uuid.uuid4(), "name": f"Category{i}", "description": "Benchmark data"} for i in range(max(1, entries // 1000))]
+    apps = [
+        {"id": uuid.uuid4(), "name": f"App{i}", "description": f"https://app{i}.example.com", "category_id": cats[i % len(cats)]["id"]}
+        for i in range(max(1, entries // 10))
+    ]
+    passwords = [
+        {
+            "id": uuid.uuid4(), "application_id": apps[i % len(apps)]["id"], "username": f"user{i}",
+            "environment": ("Production", "Staging", "Development")[i % 3], "encrypted_password": b"x" * 32, "nonce": b"n" * 12
+        }
+        for i in range(entries)
+    ]
+    with engine.begin() as conn:
+        conn.execute(insert(models.Category.__table__), cats)
+        conn.execute(insert(models.Application.__table__), apps)
+        conn.execute(insert(models.PasswordEntry.__table__), passwords)
+    search.install(engine)
+
+
+async def best_of(db, q: str, repeat: int = 5) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await search.search(db, q, limit=20)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+async def measure(path: str):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    results = {}
+    async with AsyncSession(engine) as db:
+        for q in QUERIES:
+            indexed = await best_of(db, q)
+            has_fts = search.has_fts
+            search.has_fts = lambda db: asyncio.sleep(0, result=False)
+            try:
+                scan = await best_of(db, q, repeat=1)
+            finally:
+                search.has_fts = has_fts
+            results[q] = (indexed, scan)
+            print(f"{q!r:>16}: fts5 {indexed * 1000:7.2f} ms  like {scan * 1000:8.1f} ms")
+    await engine.dispose()
+    return results
+
+
+def run_benchmark(entries: int = 100000):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        engine = create_engine(f"sqlite:///{path}")
+        populate(engine, entries)
+        engine.dispose()
+        return asyncio.run(measure(path))
+
+
+if __name__ == "__main__":
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
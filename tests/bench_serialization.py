@@ -0,0 +1,81 @@
+"""
+Benchmark for list endpoint serialization: ORM objects validated through the
+response_model (FastAPI's default path) versus column tuples encoded with orjson.
+Run: python -m tests.bench_serialization [rows]
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import List
+
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from app import models, schemas
+from app.main import APPLICATION_COLUMNS, CATEGORY_COLUMNS, PASSWORD_COLUMNS, rows_json
+
+CASES = [
+    ("categories", models.Category, schemas.CategoryResponse, CATEGORY_COLUMNS),
+    ("applications", models.Application, schemas.ApplicationResponse, APPLICATION_COLUMNS),
+    ("passwords", models.PasswordEntry, schemas.PasswordEntryResponse, PASSWORD_COLUMNS),
+]
+
+
+def populate(engine, rows: int):
+    models.Base.metadata.create_all(bind=engine)
+    with sessionmaker(bind=engine)() as db:
+        cats = [models.Category(name=f"Category{i}", description="Benchmark data") for i in range(rows)]
+        db.add_all(cats)
+        db.flush()
+        apps = [models.Application(name=f"App{i}", description="Benchmark app", category_id=cats[i % len(cats)].id) for i in range(rows)]
+        db.add_all(apps)
+        db.flush()
+        db.add_all([
+            models.PasswordEntry(application_id=apps[i % len(apps)].id, username=f"user{i}", encrypted_password=b"x" * 32, nonce=b"n" * 12)
+            for i in range(rows)
+        ])
+        db.commit()
+
+
+def best_of(fn, repeat: int = 5) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def run_benchmark(rows: int = 10000):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        populate(engine, rows)
+        Session = sessionmaker(bind=engine)
+        results = {}
+        for name, model, schema, columns in CASES:
+            adapter = TypeAdapter(List[schema])
+
+            def orm_pydantic():
+                with Session() as db:
+                    objs = db.execute(select(model)).scalars().all()
+                    validated = adapter.validate_python(objs, from_attributes=True)
+                    return json.dumps(adapter.dump_python(validated, mode="json")).encode("utf-8")
+
+            def columns_orjson():
+                with Session() as db:
+                    result = db.execute(select(*columns))
+                    return rows_json(result.keys(), result)
+
+            assert json.loads(orm_pydantic()) == json.loads(columns_orjson())
+            before, after = best_of(orm_pydantic), best_of(columns_orjson)
+            results[name] = (before, after)
+            print(f"{name:>12}: {rows} rows  orm+pydantic {before * 1000:7.1f} ms  columns+orjson {after * 1000:7.1f} ms  ({before / after:.1f}x)")
+        engine.dispose()
+    return results
+
+
+if __name__ == "__main__":
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
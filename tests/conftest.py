@@ -0,0 +1,17 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app import crypto, models, users
+
+
+@pytest.fixture
+def db(tmp_path):
+    """A session on a fresh SQLite database of its own (test_vault.py shares test.db instead)."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'vault.db'}")
+    models.Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
+    users.cache.invalidate()
+    crypto.key_cache.clear()
@@ -0,0 +1,37 @@
+import datetime
+
+from app import audit, crypto, fields, models
+
+
+def test_strength():
+    assert audit.strength("") == 0
+    assert audit.strength("Password1") == 0
+    assert audit.strength("aaaaaaaaaaaa") == 0
+    assert audit.strength("abcdefgh1234") < audit.strength("k3#Tq9!zW2@v")
+    assert audit.strength("summer2023") < audit.AUDIT_MIN_STRENGTH
+    assert audit.strength("kT7#qL2!vX9@zR4$") == 4
+
+
+def test_refresh_and_report(db):
+    dek = crypto.generate_data_key()
+    cipher = crypto.CipherContext(dek)
+    app = models.Application(name="App", category=models.Category(name="Cat"))
+    old = datetime.datetime.utcnow() - datetime.timedelta(days=audit.AUDIT_MAX_AGE_DAYS + 1)
+    passwords = ["hunter2", "hunter2", "kT7#qL2!vX9@zR4$", "hunter2"]
+    for i, (ciphertext, nonce) in enumerate(cipher.encrypt_many(passwords)):
+        db.add(models.PasswordEntry(application=app, username=f"u{i}", encrypted_password=ciphertext, nonce=nonce, created_at=old))
+    # One entry sealed with another key cannot be audited
+    ciphertext, nonce = crypto.CipherContext(crypto.generate_data_key()).encrypt("lost")
+    db.add(models.PasswordEntry(application=app, username="other", encrypted_password=ciphertext, nonce=nonce))
+    db.commit()
+
+    assert audit.refresh(db, dek, cipher, batch_size=2) == (4, 1)
+    # Audited and unreadable entries are not visited again
+    assert audit.refresh(db, dek, cipher) == (0, 0)
+
+    report = audit.report(db, fields.FieldCodec(dek, cipher))
+    assert (report["entries"], report["audited"]) == (5, 4)
+    assert (report["reuse_groups"], report["reused_count"]) == (1, 3)
+    assert sorted(e["username"] for e in report["reused"][0]["entries"]) == ["u0", "u1", "u3"]
+    assert report["weak_count"] == 3 and report["stale_count"] == 4
+    assert report["weak"][0]["application"] == "App"
@@ -0,0 +1,104 @@
+import time
+from app import crypto
+
+SALT = b"s" * 16
+
+def test_key_cache_hits_and_bound():
+    cache = crypto.KeyCache(max_size=2, ttl=60)
+    fp_a = cache.fingerprint("a", SALT)
+    fp_b = cache.fingerprint("b", SALT)
+    fp_c = cache.fingerprint("c", SALT)
+    assert cache.get(fp_a) is None
+
+    cache.put(fp_a, b"A" * 32)
+    assert cache.get(fp_a) == b"A" * 32
+
+    # Inserting a third key evicts the least recently used one and wipes it
+    stored = cache._entries[fp_a][0]
+    cache.put(fp_b, b"B" * 32)
+    cache.put(fp_c, b"C" * 32)
+    assert cache.get(fp_a) is None
+    assert stored == bytearray(32)
+    assert cache.stats() == {"size": 2, "hits": 1, "misses": 2, "evictions": 1}
+
+def test_key_cache_ttl():
+    cache = crypto.KeyCache(max_size=4, ttl=1)
+    fp = cache.fingerprint("a", SALT)
+    cache.put(fp, b"A" * 32)
+    cache._entries[fp] = (cache._entries[fp][0], time.monotonic() - 1)
+    assert cache.get(fp) is None
+    assert cache.stats()["size"] == 0
+
+def test_key_cache_fingerprint_binds_salt():
+    cache = crypto.KeyCache()
+    assert cache.fingerprint("a", SALT) != cache.fingerprint("a", b"t" * 16)
+    # Fingerprints depend on the per-process secret, not just the inputs
+    assert cache.fingerprint("a", SALT) != crypto.KeyCache().fingerprint("a", SALT)
+
+def test_derive_key_uses_cache():
+    crypto.key_cache.clear()
+    before = crypto.key_cache.stats()
+    k1 = crypto.derive_key("cached", SALT)
+    k2 = crypto.derive_key("cached", SALT)
+    after = crypto.key_cache.stats()
+    assert k1 == k2 == crypto.derive_key_uncached("cached", SALT)
+    assert after["hits"] == before["hits"] + 1
+    assert after["misses"] == before["misses"] + 1
+
+def test_kdf_params():
+    cheap = crypto.KdfParams(time_cost=1, memory_cost=8192, parallelism=1)
+    assert crypto.derive_key_uncached("pw", SALT, cheap) != crypto.derive_key_uncached("pw", SALT, cheap._replace(time_cost=2))
+    # Keys derived with different parameters never share a cache entry
+    cache = crypto.KeyCache()
+    assert cache.fingerprint("pw", SALT, cheap) != cache.fingerprint("pw", SALT, cheap._replace(parallelism=2))
+
+def test_calibrate():
+    from app import calibrate
+    params = calibrate.calibrate(target_ms=50, max_memory_kib=0, parallelism=1)
+    assert params.memory_cost == calibrate.MIN_MEMORY_KIB and params.time_cost >= 1
+
+def test_cipher_context_batches():
+    key = b"k" * 32
+    cipher = crypto.CipherContext(key)
+    plaintexts = [f"secret-{i}" for i in range(50)] + ["ünïcødé", ""]
+    encrypted = cipher.encrypt_many(plaintexts)
+    assert len({nonce for _, nonce in encrypted}) == len(plaintexts)
+    assert all(len(nonce) == crypto.NONCE_LENGTH for _, nonce in encrypted)
+
+    # Interoperates with the single-entry functions
+    assert crypto.decrypt_password(*encrypted[0], key) == "secret-0"
+    assert cipher.decrypt(*crypto.encrypt_password("x", key)) == "x"
+
+    tampered = encrypted[:2] + [(b"\x00" * 20, encrypted[2][1])]
+    assert cipher.decrypt_many(tampered) == ["secret-0", "secret-1", None]
+    assert crypto.CipherContext(b"o" * 32).decrypt_many(encrypted[:1]) == [None]
+
+    # Bound methods survive pickling (process pool)
+    import pickle
+    assert pickle.loads(pickle.dumps(cipher.decrypt_many))(encrypted) == plaintexts
+
+def test_cipher_context_microbenchmark():
+    key = b"k" * 32
+    plaintexts = [f"P@ssw0rd-{i:06d}" for i in range(5000)]
+
+    def best_of(fn, repeat=3):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = fn()
+            times.append(time.perf_counter() - start)
+        return min(times), result
+
+    per_call, _ = best_of(lambda: [crypto.encrypt_password(p, key) for p in plaintexts])
+    cipher = crypto.CipherContext(key)
+    batched, encrypted = best_of(lambda: cipher.encrypt_many(plaintexts))
+    decrypt_per_call, _ = best_of(lambda: [crypto.decrypt_password(c, n, key) for c, n in encrypted])
+    decrypt_batched, decrypted = best_of(lambda: cipher.decrypt_many(encrypted))
+    print(
+        f"\nencrypt {len(plaintexts)}: per-call {per_call * 1000:.1f} ms, context {batched * 1000:.1f} ms; "
+        f"decrypt: per-call {decrypt_per_call * 1000:.1f} ms, context {decrypt_batched * 1000:.1f} ms"
+    )
+    assert decrypted == plaintexts
+    # Bound is loose so scheduler noise cannot fail the suite; the context only saves per-call cipher setup
+    assert batched < per_call * 1.5
+    assert decrypt_batched < decrypt_per_call * 1.5
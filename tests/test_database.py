@@ -0,0 +1,46 @@
+from sqlalchemy import text
+from app import database
+
+
+def test_sqlite_profile(tmp_path):
+    engine = database.make_engine(f"sqlite:///{tmp_path / 'tuned.db'}")
+    try:
+        with engine.connect() as conn:
+            pragma = lambda name: conn.execute(text(f"PRAGMA {name}")).scalar()
+            assert pragma("journal_mode") == "wal"
+            assert pragma("synchronous") == 1  # NORMAL
+            assert pragma("busy_timeout") == database.SQLITE_PRAGMAS["busy_timeout"]
+            assert pragma("cache_size") == database.SQLITE_PRAGMAS["cache_size"]
+        assert engine.pool.size() == database.DB_POOL_SIZE
+    finally:
+        engine.dispose()
+
+
+def test_engine_options():
+    options = database.engine_options("postgresql://u:p@localhost/db")
+    assert options["pool_pre_ping"] == database.DB_POOL_PRE_PING
+    assert options["pool_size"] == database.DB_POOL_SIZE
+    assert options["pool_recycle"] == database.DB_POOL_RECYCLE
+    # In-memory SQLite keeps its single-connection pool
+    assert database.engine_options("sqlite://") == {"connect_args": {"check_same_thread": False}}
+
+
+def test_async_url():
+    assert database.async_url("postgresql://u:p@db:5432/vault") == "postgresql+asyncpg://u:p@db:5432/vault"
+    assert database.async_url("postgresql+psycopg2://u:p@db/vault") == "postgresql+asyncpg://u:p@db/vault"
+    assert database.async_url("sqlite:///./vault.db") == "sqlite+aiosqlite:///./vault.db"
+
+
+def test_async_sqlite_profile(tmp_path):
+    import asyncio
+
+    async def check():
+        engine = database.make_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'async.db'}")
+        try:
+            async with engine.connect() as conn:
+                assert (await conn.execute(text("PRAGMA journal_mode"))).scalar() == "wal"
+                assert (await conn.execute(text("PRAGMA busy_timeout"))).scalar() == database.SQLITE_PRAGMAS["busy_timeout"]
+        finally:
+            await engine.dispose()
+
+    asyncio.run(check())
@@ -0,0 +1,191 @@
+import pytest
+from app import audit, crypto, csv_utils, fields, keys, models, users
+
+
+def add_entries(db, cipher, count):
+    app = models.Application(name="App", category=models.Category(name="Cat"))
+    for i, (ciphertext, nonce) in enumerate(cipher.encrypt_many([f"pw{i}" for i in range(count)])):
+        db.add(models.PasswordEntry(application=app, username=f"u{i}", encrypted_password=ciphertext, nonce=nonce))
+    db.commit()
+
+
+def read_all(db, cipher):
+    entries = db.query(models.PasswordEntry).order_by(models.PasswordEntry.username).all()
+    return cipher.decrypt_many([(e.encrypted_password, e.nonce) for e in entries])
+
+
+def test_wrap_key():
+    kek, dek = crypto.generate_data_key(), crypto.generate_data_key()
+    wrapped = crypto.wrap_key(kek, dek)
+    assert crypto.unwrap_key(kek, wrapped) == dek
+    with pytest.raises(ValueError):
+        crypto.unwrap_key(crypto.generate_data_key(), wrapped)
+
+
+def test_legacy_vault_password_change(db):
+    # Vaults from before key wrapping sealed entries with the password-derived key
+    salt = crypto.generate_salt()
+    db.add(models.User(username="admin", password_hash=crypto.hash_master_password("old"), master_key_salt=salt))
+    db.commit()
+    legacy_key = crypto.derive_key("old", salt)
+    add_entries(db, crypto.CipherContext(legacy_key), 3)
+
+    user = users.cache.load(db)
+    assert keys.unlock(user, "old") == legacy_key
+    user = keys.change_master_password(db, user, "old", "new")
+
+    assert user.wrapped_dek is not None and user.master_key_salt != salt
+    assert crypto.verify_master_password("new", user.password_hash)
+    # The legacy key becomes the DEK: nothing was re-encrypted
+    assert keys.unlock(user, "new") == legacy_key
+
+
+def test_data_key_rotation_is_resumable(db):
+    db.add(models.User(username="admin", password_hash="-", **keys.new_user_keys("mp")))
+    db.commit()
+    user = users.cache.load(db)
+    old_dek = keys.unlock(user, "mp")
+    add_entries(db, crypto.CipherContext(old_dek), 12)
+
+    user = keys.rotate_data_key(db, user, "mp")
+    new_dek = keys.unlock(user, "mp")
+    assert user.dek_version == 2 and new_dek != old_dek
+    with pytest.raises(ValueError):
+        keys.rotate_data_key(db, user, "mp")
+
+    class Stop(Exception):
+        pass
+
+    def stop_after_first_batch(stats):
+        raise Stop()
+
+    with pytest.raises(Stop):
+        keys.reencrypt_entries(db, new_dek, batch_size=5, progress=stop_after_first_batch, grace=0)
+    # Half-way: every entry is still readable through the fallback to the previous key
+    assert db.query(models.PasswordEntry).filter(models.PasswordEntry.key_version == 2).count() == 5
+    assert read_all(db, keys.data_cipher(db, new_dek)) == sorted(f"pw{i}" for i in range(12))
+
+    stats = keys.reencrypt_entries(db, new_dek, batch_size=5, grace=0)
+    assert (stats.entries, stats.failed, stats.batches) == (7, 0, 2)
+    assert users.cache.load(db).previous_wrapped_dek is None
+    assert read_all(db, crypto.CipherContext(new_dek)) == sorted(f"pw{i}" for i in range(12))
+    # Reuse fingerprints are re-keyed with the entries
+    reuse = audit.Auditor(new_dek).reuse_fingerprint
+    assert all(e.reuse_fingerprint == reuse(f"pw{e.username[1:]}") for e in db.query(models.PasswordEntry))
+
+
+def test_rotation_waits_for_old_key_writers(db):
+    db.add(models.User(username="admin", password_hash="-", **keys.new_user_keys("mp")))
+    db.commit()
+    user = users.cache.load(db)
+    old_dek = keys.unlock(user, "mp")
+    importer = csv_utils.BatchImporter(db, old_dek, csv_utils.ImportStats())
+    importer.import_batch([(2, {"name": "App", "username": "u0", "password": "pw0"})])
+    db.commit()
+
+    user = keys.rotate_data_key(db, user, "mp")
+    new_dek = keys.unlock(user, "mp")
+    # An import that unlocked before the rotation cannot write its next batch
+    with pytest.raises(keys.KeyRotated):
+        importer.import_batch([(3, {"name": "App", "username": "u1", "password": "pw1"})])
+    db.rollback()
+    # Nor can a new one match duplicates while fingerprints are under two keys
+    with pytest.raises(keys.RotationInProgress):
+        csv_utils.process_csv_import(b"name,username,password\nApp,u0,pw0\n", new_dek, db)
+
+    # A writer still holding the old key (another worker's cached record) commits after the first pass
+    late = []
+
+    def late_writer(stats):
+        if not late:
+            app = db.query(models.Application).one()
+            ciphertext, nonce = crypto.CipherContext(old_dek).encrypt_many(["pw2"])[0]
+            db.add(models.PasswordEntry(application=app, username="u2", encrypted_password=ciphertext, nonce=nonce, key_version=1))
+            db.commit()
+            late.append(True)
+
+    stats = keys.reencrypt_entries(db, new_dek, progress=late_writer, grace=0.3)
+    assert stats.failed == 0
+    assert users.cache.load(db).previous_wrapped_dek is None
+    assert read_all(db, crypto.CipherContext(new_dek)) == ["pw0", "pw2"]
+
+
+def test_concurrent_key_changes_do_not_overwrite(db):
+    db.add(models.User(username="admin", password_hash=crypto.hash_master_password("mp"), **keys.new_user_keys("mp")))
+    db.commit()
+    stale = users.cache.load(db)
+    old_dek = keys.unlock(stale, "mp")
+    add_entries(db, crypto.CipherContext(old_dek), 2)
+
+    # Two requests that verified the password against the same record both rotate
+    rotated = keys.rotate_data_key(db, stale, "mp")
+    new_dek = keys.unlock(rotated, "mp")
+    with pytest.raises(keys.KeysChanged):
+        keys.rotate_data_key(db, stale, "mp")
+    # Nor may a password change or login upgrade from the old record undo the rotation
+    with pytest.raises(keys.KeysChanged):
+        keys.change_master_password(db, stale, "mp", "other")
+    with pytest.raises(keys.KeysChanged):
+        keys.update_user(db, stale, {"password_hash": "-"})
+
+    current = users.cache.load(db)
+    assert current.dek_version == 2 and keys.unlock(current, "mp") == new_dek
+    keys.reencrypt_entries(db, new_dek, grace=0)
+    assert read_all(db, crypto.CipherContext(new_dek)) == ["pw0", "pw1"]
+
+
+def test_metadata_encryption(db, monkeypatch):
+    db.add(models.User(username="admin", password_hash="-", **keys.new_user_keys("mp")))
+    db.commit()
+    dek = keys.unlock(users.cache.load(db), "mp")
+    add_entries(db, crypto.CipherContext(dek), 6)
+    db.query(models.Application).update({"description": "secret app"})
+    db.commit()
+
+    # Plaintext rows from before the setting get sealed and indexed
+    monkeypatch.setattr(fields, "ENCRYPT_METADATA", True)
+    stats = keys.convert_metadata(db, dek, batch_size=4)
+    assert (stats.entries, stats.failed) == (6, 0)
+    assert db.query(models.PasswordEntry).filter(models.PasswordEntry.username.is_not(None)).count() == 0
+    app = db.query(models.Application).one()
+    assert app.description is None and fields.FieldCodec(dek).description(None, app.encrypted_description) == "secret app"
+
+    # Rotation re-seals the fields and re-keys the blind index
+    new_dek = keys.unlock(keys.rotate_data_key(db, users.cache.load(db), "mp"), "mp")
+    keys.reencrypt_entries(db, new_dek, grace=0)
+    codec = fields.FieldCodec(new_dek, crypto.CipherContext(new_dek))
+    entry = db.query(models.PasswordEntry).filter(models.PasswordEntry.username_index == codec.username_index("u3")).one()
+    assert codec.username(entry.username, entry.encrypted_username) == "u3"
+    assert codec.description(None, db.query(models.Application).one().encrypted_description) == "secret app"
+
+    # And back to plaintext
+    monkeypatch.setattr(fields, "ENCRYPT_METADATA", False)
+    keys.convert_metadata(db, new_dek)
+    db.expire_all()
+    assert sorted(e.username for e in db.query(models.PasswordEntry)) == [f"u{i}" for i in range(6)]
+    assert db.query(models.Application).one().description == "secret app"
+
+
+def test_upgrade_on_login(db, monkeypatch):
+    from argon2 import PasswordHasher
+    # Vault created with the legacy parameters
+    salt = crypto.generate_salt()
+    db.add(models.User(username="admin", password_hash=crypto.hash_master_password("mp"), master_key_salt=salt))
+    db.commit()
+    user = users.cache.load(db)
+    assert user.kdf_params == crypto.LEGACY_KDF_PARAMS
+    dek = keys.unlock(user, "mp")
+
+    # The deployment is reconfigured
+    cheap = crypto.KdfParams(time_cost=1, memory_cost=8192, parallelism=1)
+    monkeypatch.setattr(crypto, "KDF_PARAMS", cheap)
+    monkeypatch.setattr(crypto, "ph", PasswordHasher(time_cost=1, memory_cost=8192, parallelism=1))
+    assert crypto.needs_rehash(user.password_hash)
+
+    upgraded = keys.upgrade_on_login(db, user, "mp")
+    assert upgraded.kdf_params == cheap
+    assert "m=8192" in upgraded.password_hash and not crypto.needs_rehash(upgraded.password_hash)
+    assert crypto.verify_master_password("mp", upgraded.password_hash)
+    assert keys.unlock(upgraded, "mp") == dek
+    # Already current: nothing to do
+    assert keys.upgrade_on_login(db, upgraded, "mp") is upgraded
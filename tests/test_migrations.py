@@ -0,0 +1,48 @@
+import uuid
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import sessionmaker
+from app import models, migrations
+
+
+def test_upgrade_legacy_sqlite(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+
+    # 1. Build a database the way older versions did: hex GUIDs, no FK indexes
+    monkeypatch.setattr(models, "GUID_STORAGE", "hex")
+    models.Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX uq_applications_category_name"))
+        conn.execute(text("DROP INDEX ix_passwords_application_id"))
+    Session = sessionmaker(bind=engine)
+    with Session() as db:
+        cat = models.Category(name="Legacy")
+        app = models.Application(name="OldApp", category=cat)
+        db.add(models.PasswordEntry(application=app, username="u", encrypted_password=b"c", nonce=b"n"))
+        db.commit()
+        cat_id, app_id = cat.id, app.id
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX ix_passwords_fingerprint"))
+        conn.execute(text("ALTER TABLE passwords DROP COLUMN fingerprint"))
+        assert conn.execute(text("SELECT typeof(id) FROM categories")).scalar() == "text"
+
+    # 2. Upgrade to binary storage
+    monkeypatch.setattr(models, "GUID_STORAGE", "binary")
+    migrations.upgrade(engine)
+    migrations.upgrade(engine)  # idempotent
+
+    with engine.connect() as conn:
+        for table, column in [("categories", "id"), ("applications", "category_id"), ("passwords", "application_id")]:
+            assert conn.execute(text(f"SELECT typeof({column}) FROM {table}")).scalar() == "blob"
+    assert "fingerprint" in {c["name"] for c in inspect(engine).get_columns("passwords")}
+    index_names = {i["name"] for i in inspect(engine).get_indexes("passwords")}
+    assert "ix_passwords_application_id" in index_names
+    assert "ix_passwords_fingerprint" in index_names
+    index_names = {i["name"] for i in inspect(engine).get_indexes("applications")}
+    assert "uq_applications_category_name" in index_names
+
+    # 3. Relationships still resolve through the converted keys
+    with Session() as db:
+        app = db.query(models.Application).filter(models.Application.id == app_id).one()
+        assert isinstance(app.id, uuid.UUID)
+        assert app.category.id == cat_id
+        assert [p.username for p in app.passwords] == ["u"]